@@ -1,31 +1,223 @@
 import json
 import datetime
 import os
+import glob
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
 
-AUDIT_LOG_JSON = "audit_log.json"
+AUDIT_LOG_JSON = "audit_log.json"  # legacy single-file log, see import_json_log
 
-def log_to_json(query, field_instruction, prompt, llm_output):
+# ========== Configuration ==========
+# Entries are appended to SQLite segments (WAL mode) in AUDIT_LOG_DIR. A new segment starts
+# every period (AUDIT_SEGMENT_FORMAT) or once the current one grows past AUDIT_SEGMENT_MB.
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_logs")
+AUDIT_SEGMENT_FORMAT = os.getenv("AUDIT_SEGMENT_FORMAT", "%Y-%m")
+AUDIT_SEGMENT_MB = float(os.getenv("AUDIT_SEGMENT_MB", "64"))
+AUDIT_BATCH_SIZE = 200
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+# ========== Segments ==========
+def _segment_paths():
+    return sorted(glob.glob(os.path.join(AUDIT_LOG_DIR, "audit_log-*.db")))
+
+
+def _current_segment():
+    period = datetime.datetime.now().strftime(AUDIT_SEGMENT_FORMAT)
+    existing = sorted(glob.glob(os.path.join(AUDIT_LOG_DIR, f"audit_log-{period}-*.db")))
+    index = int(existing[-1].rsplit("-", 1)[1][:-3]) if existing else 0
+    path = os.path.join(AUDIT_LOG_DIR, f"audit_log-{period}-{index:04d}.db")
+    if os.path.exists(path) and os.path.getsize(path) > AUDIT_SEGMENT_MB * 1024 * 1024:
+        path = os.path.join(AUDIT_LOG_DIR, f"audit_log-{period}-{index + 1:04d}.db")
+    return path
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS audit_log ("
+        " id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, user_query TEXT, field_instruction TEXT,"
+        " prompt TEXT, llm_output TEXT, metrics TEXT)"
+    )
+    # Segments written before stage metrics were recorded lack the column
+    if "metrics" not in {row[1] for row in conn.execute("PRAGMA table_info(audit_log)")}:
+        conn.execute("ALTER TABLE audit_log ADD COLUMN metrics TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS audit_log_timestamp ON audit_log(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS audit_log_user_query ON audit_log(user_query)")
+    return conn
+
+
+# ========== Background Writer ==========
+def _write_batch(entries):
+    os.makedirs(AUDIT_LOG_DIR, exist_ok=True)
+    conn = _connect(_current_segment())
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO audit_log(timestamp, user_query, field_instruction, prompt, llm_output, metrics)"
+                " VALUES (:timestamp, :user_query, :field_instruction, :prompt, :llm_output, :metrics)",
+                entries,
+            )
+    finally:
+        conn.close()
+
+
+def _fallback_path():
+    # One file per process, so only that process's writer ever appends to it
+    return os.path.join(AUDIT_LOG_DIR, f"audit_log-fallback-{os.getpid()}.jsonl")
+
+
+def _write_fallback(entries):
+    os.makedirs(AUDIT_LOG_DIR, exist_ok=True)
+    with open(_fallback_path(), "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def _replay_fallback(path):
+    # Moves the entries of a fallback file into the current segment, then deletes the file
+    with open(path, "r", encoding="utf-8") as f:
+        entries = []
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+    if entries:
+        _write_batch(entries)
+    os.remove(path)
+    return len(entries)
+
+
+def _drain(first):
+    # Takes whatever is already queued; batches grow on their own while a write is in progress
+    batch = [first]
+    while len(batch) < AUDIT_BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run_writer():
+    while True:
+        batch = _drain(_queue.get())
+        try:
+            _write_batch(batch)
+        except Exception:
+            # Kept on disk instead of dropped; the next successful write moves them into a segment
+            logger.warning("Audit log write failed, keeping %d entries in %s", len(batch), _fallback_path(),
+                           exc_info=True)
+            try:
+                _write_fallback(batch)
+            except Exception:
+                logger.exception("Audit log fallback write failed, %d entries lost", len(batch))
+        else:
+            if os.path.exists(_fallback_path()):
+                try:
+                    count = _replay_fallback(_fallback_path())
+                    logger.info("Recovered %d audit log entries from %s", count, _fallback_path())
+                except Exception:
+                    logger.warning("Audit log fallback replay failed, will retry", exc_info=True)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run_writer, name="audit-log-writer", daemon=True)
+            _writer.start()
+
+
+def flush():
+    # Blocks until every queued entry has been written
+    _queue.join()
+
+
+atexit.register(flush)
+
+
+# ========== Public API ==========
+def log_to_json(query, field_instruction, prompt, llm_output, metrics=None):
+    # Kept under its original name; the entry is queued and written by the background writer.
+    # `metrics` is an optional per-stage summary (see metrics.Run.summary), stored as JSON.
     log_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
         "user_query": query,
         "field_instruction": field_instruction,
         "prompt": prompt,
-        "llm_output": llm_output
+        "llm_output": llm_output,
+        "metrics": json.dumps(metrics) if metrics is not None else None
     }
+    _ensure_writer()
+    _queue.put(log_entry)
 
-    # Load existing logs if file exists
-    if os.path.exists(AUDIT_LOG_JSON):
-        with open(AUDIT_LOG_JSON, "r") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-    else:
-        data = []
 
-    # Append new log
-    data.append(log_entry)
+def search_logs(query=None, since=None, until=None, limit=100):
+    # Newest entries first. `query` matches user_query as a prefix; since/until are ISO timestamps.
+    clauses, params = [], []
+    if query:
+        clauses.append("user_query >= ? AND user_query < ?")
+        params += [query, query + "\uffff"]
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    results = []
+    for path in reversed(_segment_paths()):
+        conn = _connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                f"SELECT timestamp, user_query, field_instruction, prompt, llm_output, metrics FROM audit_log"
+                f" {where} ORDER BY timestamp DESC LIMIT ?",
+                params + [limit - len(results)],
+            ).fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            entry = dict(row)
+            entry["metrics"] = json.loads(entry["metrics"]) if entry["metrics"] else None
+            results.append(entry)
+        if len(results) >= limit:
+            break
+    return results
+
+
+def import_fallback_logs():
+    # Recovers entries that processes which have since exited left in fallback files
+    return sum(_replay_fallback(path) for path in
+               glob.glob(os.path.join(AUDIT_LOG_DIR, "audit_log-fallback-*.jsonl")))
+
 
-    # Save updated logs
-    with open(AUDIT_LOG_JSON, "w") as f:
-        json.dump(data, f, indent=2)
+def import_json_log(path=AUDIT_LOG_JSON):
+    # One-off migration of the old read-modify-write JSON log into the segment store
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+    if data:
+        _write_batch([{key: entry.get(key) for key in
+                       ("timestamp", "user_query", "field_instruction", "prompt", "llm_output", "metrics")}
+                      for entry in data])
+    return len(data)
@@ -0,0 +1,189 @@
+# batch_extract.py
+# Headless batch extraction: runs the doc_input -> chunking/retrieval -> field extraction pipeline
+# over a directory, glob or manifest on a process pool, without Streamlit.
+#
+#   python batch_extract.py "drops/2024-06-01/*.pdf" --query "List all invoices" \
+#       --fields "invoice number, date, total" --workers 8 --output results.jsonl
+#
+# Results are appended to a JSONL file as documents finish, one record per document with its
+# status and stage timings. Re-running the same command skips documents that already succeeded.
+# Each worker rate-limits its own LLM calls to LLM_RPM/workers and LLM_TPM/workers.
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".png", ".jpg", ".jpeg"}
+
+
+# ========== Inputs ==========
+def _expand(pattern):
+    if os.path.isdir(pattern):
+        for root, _, files in os.walk(pattern):
+            for name in sorted(files):
+                yield os.path.join(root, name)
+    else:
+        yield from sorted(glob.glob(pattern, recursive=True))
+
+
+def collect_inputs(patterns, manifest=None):
+    paths = []
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                # Manifest lines are either plain paths or JSON objects with a "path" key
+                paths.append(json.loads(line)["path"] if line.startswith("{") else line)
+    for pattern in patterns:
+        paths.extend(_expand(pattern))
+
+    seen = set()
+    unique = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if path not in seen and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def document_id(path):
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+# ========== Progress ==========
+def load_completed(progress_path):
+    completed = set()
+    if os.path.exists(progress_path):
+        with open(progress_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a partially written last line from an interrupted run
+                if record.get("status") == "ok":
+                    completed.add(record["document_id"])
+    return completed
+
+
+# ========== Worker ==========
+def _init_worker(workers):
+    # Workers share one API key but not limiter state, so each one gets its share of the limits
+    from map_reduce import share_rate_limits
+
+    share_rate_limits(workers)
+
+
+def process_document(path, query, field_instruction, use_cache=True):
+    from doc_input import extract_text_with_filename
+    from pipeline import run_extraction
+    import audit_logger
+
+    record = {"document_id": document_id(path), "path": path, "status": "ok", "timings": {}}
+    started = time.perf_counter()
+    with metrics.run("batch_document", path=path) as run:
+        try:
+            result = extract_text_with_filename(path, os.path.basename(path))
+            record["timings"]["extract"] = round(time.perf_counter() - started, 3)
+            text = result.get("text", "")
+            if "error" in result or not text or text.startswith("[Error"):
+                raise ValueError(result.get("error") or text or "No text extracted")
+
+            stage_started = time.perf_counter()
+            _, answer, entries = run_extraction(text, query, field_instruction, use_cache=use_cache)
+            record["timings"]["extraction"] = round(time.perf_counter() - stage_started, 3)
+            record["entries"] = entries
+            record["llm_output"] = answer
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+    record["timings"]["total"] = round(time.perf_counter() - started, 3)
+    # Per-stage breakdown (durations, pages, chunks, tokens, cache hits); the raw spans travel back
+    # separately so the parent can aggregate them and are not written to the progress file
+    record["metrics"] = run.summary()
+    record["spans"] = run.spans
+    # Pool workers exit without running atexit hooks, so queued audit entries are written now
+    audit_logger.flush()
+    return record
+
+
+# ========== Output ==========
+def write_output(progress_path, output_path):
+    from exporter import batch_result_rows, export
+
+    # One row per extracted entry; the last record wins, so documents retried after a failure
+    # appear once. Rows are streamed in batches, so memory does not grow with the output.
+    columns, batches = batch_result_rows(progress_path)
+    export(batches, columns, output_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run structured extraction over many documents.")
+    parser.add_argument("inputs", nargs="*", help="Files, directories or glob patterns")
+    parser.add_argument("--manifest", help="File listing one path (or JSON object with 'path') per line")
+    parser.add_argument("--query", required=True, help="Query to ask about each document")
+    parser.add_argument("--fields", required=True, help="Comma-separated fields, e.g. 'name, skills'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default="results.jsonl",
+                        help="Output .jsonl file, or .csv/.parquet/.xlsx/.json (merged from <output>.jsonl)")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Always call the LLM, bypassing the response cache")
+    parser.add_argument("--metrics", help="Write aggregated stage metrics here (.prom for Prometheus, else JSON)")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("OPENAI_API_KEY"):
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not os.getenv("OPENAI_API_KEY"):
+            parser.error("OPENAI_API_KEY is not set")
+
+    # Parallelism comes from the document pool; each worker OCRs its own pages serially
+    os.environ.setdefault("OCR_WORKERS", "1")
+
+    # Other formats are written once at the end from the JSONL progress file
+    merged = not args.output.endswith(".jsonl")
+    progress_path = args.output + ".jsonl" if merged else args.output
+
+    paths = collect_inputs(args.inputs, args.manifest)
+    completed = load_completed(progress_path)
+    pending = [path for path in paths if document_id(path) not in completed]
+    print(f"{len(paths)} documents, {len(paths) - len(pending)} already done, {len(pending)} to process")
+
+    failures = 0
+    started = time.perf_counter()
+    with open(progress_path, "a+", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.workers,)) as pool:
+        # Start on a fresh line if an interrupted run left a partial record behind
+        if progress.tell() > 0:
+            progress.seek(progress.tell() - 1)
+            if progress.read(1) != "\n":
+                progress.write("\n")
+        futures = [pool.submit(process_document, path, args.query, args.fields, not args.no_llm_cache) for path in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            metrics.merge_run({"spans": record.pop("spans", ())})
+            progress.write(json.dumps(record) + "\n")
+            progress.flush()
+            failures += record["status"] != "ok"
+            print(f"[{done}/{len(pending)}] {record['status']:5} {record['timings']['total']:7.2f}s {record['path']}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Finished {len(pending)} documents in {elapsed:.1f}s ({failures} failed)")
+
+    if merged:
+        write_output(progress_path, args.output)
+    if args.metrics:
+        metrics.export(args.metrics)
+        print(f"Stage metrics written to {args.metrics}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
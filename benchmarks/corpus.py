@@ -0,0 +1,149 @@
+# benchmarks/corpus.py
+# Deterministic synthetic corpus: text-layer PDFs, scanned PDFs, PNG/JPEG, DOCX and TXT at
+# several sizes. The text mixes filler with names, organisations, dates, amounts, emails and
+# invoice numbers so that OCR, NER, chunking and field parsing all have realistic work to do.
+import io
+import os
+import random
+
+SIZES = {"small": 1, "medium": 10, "large": 50}  # pages per document
+
+_WORDS = (
+    "agreement party invoice total amount payment terms delivery schedule clause liability "
+    "services provider customer period notice termination confidential account balance due "
+    "reference order quantity unit price tax subtotal shipping address signature witness"
+).split()
+_NAMES = ["John Smith", "Maria Garcia", "Wei Chen", "Aisha Khan", "Lukas Müller", "Priya Patel"]
+_ORGS = ["Acme Corp", "Globex Ltd", "Initech GmbH", "Umbrella Inc", "Stark Industries"]
+_CITIES = ["London", "Berlin", "New York", "Mumbai", "Toronto", "Sydney"]
+
+
+def page_text(rng, lines=40):
+    out = []
+    for _ in range(lines):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 12))]
+        roll = rng.random()
+        if roll < 0.15:
+            words.insert(0, f"{rng.choice(_NAMES)} of {rng.choice(_ORGS)} in {rng.choice(_CITIES)}")
+        elif roll < 0.25:
+            words.append(f"on {rng.randint(1, 28)} March {rng.randint(2015, 2025)}")
+        elif roll < 0.35:
+            words.append(f"${rng.randint(10, 99999)}.{rng.randint(0, 99):02d}")
+        elif roll < 0.40:
+            words.append(f"contact {rng.choice(_NAMES).split()[0].lower()}@example.com")
+        elif roll < 0.45:
+            words.append(f"Invoice No: INV-{rng.randint(10000, 99999)}")
+        out.append(" ".join(words).capitalize() + ".")
+    return "\n".join(out)
+
+
+def document_pages(seed, pages):
+    rng = random.Random(seed)
+    return [page_text(rng) for _ in range(pages)]
+
+
+def render_page_image(text, width=1275, height=1650):
+    # Letter page at 150 dpi, black text on white, like a clean office scan
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 20)
+    except OSError:
+        font = ImageFont.load_default()
+    y = 80
+    for line in text.splitlines():
+        draw.text((80, y), line[:95], fill=0, font=font)
+        y += 34
+        if y > height - 80:
+            break
+    return image
+
+
+def write_text_pdf(path, pages):
+    import fitz
+
+    with fitz.open() as doc:
+        for text in pages:
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=9)
+        doc.save(path)
+
+
+def write_scanned_pdf(path, pages):
+    import fitz
+
+    with fitz.open() as doc:
+        for text in pages:
+            buffer = io.BytesIO()
+            render_page_image(text).save(buffer, format="PNG")
+            page = doc.new_page()
+            page.insert_image(page.rect, stream=buffer.getvalue())
+        doc.save(path)
+
+
+def write_image(path, text, fmt):
+    render_page_image(text).convert("RGB").save(path, format=fmt)
+
+
+def write_docx(path, pages):
+    import docx
+
+    document = docx.Document()
+    for text in pages:
+        for line in text.splitlines():
+            document.add_paragraph(line)
+        document.add_page_break()
+    document.save(path)
+
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+
+
+def generate(out_dir, sizes=None):
+    # Returns {kind: {size: path}}; kinds whose libraries are missing are left out
+    sizes = sizes or SIZES
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = {}
+
+    writers = {
+        "pdf_text": (".pdf", write_text_pdf),
+        "pdf_scanned": (".pdf", write_scanned_pdf),
+        "docx": (".docx", write_docx),
+        "txt": (".txt", write_txt),
+    }
+    for seed, (kind, (ext, writer)) in enumerate(writers.items()):
+        for size, pages in sizes.items():
+            # Scanned pages are expensive to OCR; cap them so the suite stays runnable
+            page_count = min(pages, 10) if kind == "pdf_scanned" else pages
+            path = os.path.join(out_dir, f"{kind}_{size}{ext}")
+            try:
+                if not os.path.exists(path):
+                    writer(path, document_pages(seed * 100 + pages, page_count))
+            except ImportError:
+                break
+            corpus.setdefault(kind, {})[size] = path
+
+    for kind, fmt, ext in (("png", "PNG", ".png"), ("jpeg", "JPEG", ".jpg")):
+        path = os.path.join(out_dir, f"{kind}_page{ext}")
+        try:
+            if not os.path.exists(path):
+                write_image(path, document_pages(7, 1)[0], fmt)
+        except ImportError:
+            continue
+        corpus[kind] = {"small": path}
+    return corpus
+
+
+def llm_answer(entries, field_list, seed=0):
+    # A map_reduce-style answer with `entries` records in "Field: value" form
+    rng = random.Random(seed)
+    lines = ["Here are the extracted entries:", ""]
+    for _ in range(entries):
+        for field in field_list:
+            lines.append(f"{field}: {' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 4)))}")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,250 @@
+# chunking.py
+# Splits extracted text into chunks for embedding and retrieval. Chunk sizes are measured in
+# model tokens and derived from the LLM's context budget; page headers/footers repeated on most
+# pages are reduced to their first occurrence, and near-duplicate chunks (repeated boilerplate,
+# OCR'd letterheads) are dropped so they are neither embedded nor sent to the map stage twice.
+# A chunk only counts as a duplicate when it carries the same values (numbers, names, IDs) as
+# the earlier one: template-identical records that differ in a field are always kept.
+import os
+import re
+import hashlib
+from collections import Counter
+from functools import lru_cache
+
+import metrics
+
+
+# ========== Configuration ==========
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "800"))
+CHUNK_MIN_TOKENS = 100
+CHUNK_OVERLAP_SHARE = 0.1
+PROMPT_RESERVE_TOKENS = 1024  # map/reduce instructions, the question and the completion
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+HEADER_EDGE_LINES = 3  # lines at the top and bottom of a page that may be header/footer
+HEADER_MIN_SHARE = 0.5  # share of pages a line must repeat on to count as header/footer
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "3"))  # bits; 0 disables the filter
+NEAR_DUPLICATE_JACCARD = 0.95  # word-trigram overlap a SimHash candidate must also reach
+CHUNKING_VERSION = "tokens-v3"  # part of vector collection keys; bump when output changes
+
+PAGE_SEPARATOR = "\f"  # doc_input joins PDF pages with form feeds, as Tesseract ends its pages
+
+
+# ========== Token Budget ==========
+@lru_cache(maxsize=None)
+def _encoding(model):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=None)
+def token_counter(model="gpt-3.5-turbo"):
+    # tiktoken when its encoding can be loaded (it is fetched once, then cached on disk),
+    # otherwise ~4 characters per token
+    try:
+        encoding = _encoding(model)
+    except Exception:
+        return lambda text: len(text) // 4 + 1
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_budget(model, k):
+    # Largest chunk for which the reduce prompt can still hold k verbatim map outputs
+    context = MODEL_CONTEXT_TOKENS.get(model, 4096)
+    per_chunk = (context - PROMPT_RESERVE_TOKENS) // max(k, 1)
+    size = max(CHUNK_MIN_TOKENS, min(CHUNK_MAX_TOKENS, per_chunk))
+    return size, int(size * CHUNK_OVERLAP_SHARE)
+
+
+@lru_cache(maxsize=None)
+def get_splitter(chunk_size=800, chunk_overlap=80, model="gpt-3.5-turbo"):
+    # One splitter per setting for the whole process; sizes are in tokens
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=token_counter(model)
+    )
+
+
+# ========== Headers and Footers ==========
+# "Page 3", "p. 3 / 12", "3 of 12": labelled page numbers
+PAGE_NUMBER_RE = re.compile(
+    r"^[\W_]*((page|p\.?|seite|pg\.?)\s*\d+(\s*(of|/|von)\s*\d+)?|\d+\s*(of|von)\s*\d+)[\W_]*$", re.IGNORECASE
+)
+# "4", "- 4 -": only a page number when it goes up by one from page to page
+BARE_NUMBER_RE = re.compile(r"^[\W_]*(\d+)[\W_]*$")
+
+
+def _line_key(line, page_index=0, numbering=frozenset()):
+    # Page-number lines all share one key; other lines must repeat verbatim, so per-page values
+    # such as "Total: $1,204.00", "1250" or a year are never taken for a footer. A bare number
+    # is a page number when its offset from page_index is one of the document's numbering
+    # offsets (see _numbering).
+    line = " ".join(line.lower().split())
+    if PAGE_NUMBER_RE.match(line):
+        return "<page number>"
+    match = BARE_NUMBER_RE.match(line)
+    if match and int(match.group(1)) - page_index in numbering:
+        return "<page number>"
+    return line
+
+
+def _numbering(split_pages, min_pages):
+    # Offsets (number - page index) shared by bare numbers at the edges of at least min_pages
+    # pages, and never fewer than three: pages numbered 1, 2, 3... or 5, 6, 7... give one
+    # offset, a constant or two values that happen to be consecutive do not
+    offsets = Counter()
+    for page_index, (lines, edges) in enumerate(split_pages):
+        offsets.update({
+            int(match.group(1)) - page_index
+            for match in (BARE_NUMBER_RE.match(lines[i].strip()) for i in edges) if match
+        })
+    return frozenset(offset for offset, seen in offsets.items() if seen >= max(3, min_pages))
+
+
+def strip_repeated_lines(pages):
+    # Removes repeats of lines that sit in the top or bottom HEADER_EDGE_LINES of most pages.
+    # The first occurrence is kept, so a letterhead's company name or address can still be
+    # extracted. Returns (pages, removed line count).
+    if len(pages) < 3:
+        return pages, 0
+
+    split_pages = []
+    for page in pages:
+        lines = page.splitlines()
+        filled = [i for i, line in enumerate(lines) if line.strip()]
+        edges = set(filled[:HEADER_EDGE_LINES] + filled[-HEADER_EDGE_LINES:])
+        split_pages.append((lines, edges))
+
+    min_pages = max(2, HEADER_MIN_SHARE * len(pages))
+    numbering = _numbering(split_pages, min_pages)
+    counts = Counter()
+    for page_index, (lines, edges) in enumerate(split_pages):
+        counts.update({_line_key(lines[i], page_index, numbering) for i in edges})
+    repeated = {key for key, seen in counts.items() if key and seen >= min_pages}
+    if not repeated:
+        return pages, 0
+
+    stripped, removed, seen = [], 0, set()
+    for page_index, (lines, edges) in enumerate(split_pages):
+        kept = []
+        for i, line in enumerate(lines):
+            key = _line_key(line, page_index, numbering) if i in edges else None
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        removed += len(lines) - len(kept)
+        stripped.append("\n".join(kept))
+    return stripped, removed
+
+
+# ========== Near-Duplicates ==========
+VALUE_TOKEN_RE = re.compile(r"\w*\d\w*|[A-Z]\w*")  # numbers, amounts, IDs and capitalised names
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def simhash(shingles):
+    # 64-bit SimHash over a set of word trigrams
+    bits = [
+        format(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for s in shingles
+    ]
+    half = len(bits) / 2
+    return int("".join("1" if column.count("1") > half else "0" for column in zip(*bits)), 2)
+
+
+class NearDuplicateFilter:
+    # A chunk is a duplicate of an earlier one when
+    # - their SimHash fingerprints are within max_distance bits (the cheap candidate test),
+    # - their word-trigram sets overlap by at least NEAR_DUPLICATE_JACCARD, and
+    # - they contain exactly the same value tokens (numbers, IDs, capitalised words) in order.
+    # The last rule keeps template-identical records (invoices, form pages) that differ only in
+    # a customer name or amount: those differences are what the user wants extracted.
+    # Fingerprints are bucketed by (max_distance + 1) bands: any two within the distance share
+    # at least one band exactly, so only bucket mates are compared.
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE, min_jaccard=NEAR_DUPLICATE_JACCARD):
+        self.max_distance = max_distance
+        self.min_jaccard = min_jaccard
+        self.bands = max(max_distance, 0) + 1
+        self.width = 64 // self.bands
+        self.buckets = {}
+        self.exact = set()
+
+    def is_duplicate(self, chunk):
+        # Records the chunk when it is new. Exact repeats (ignoring case and whitespace) are
+        # always duplicates; near-duplicates only when max_distance > 0.
+        normalised = " ".join(chunk.lower().split())
+        if normalised in self.exact:
+            return True
+        self.exact.add(normalised)
+        if self.max_distance <= 0:
+            return False
+
+        shingles = _shingles(chunk)
+        values = tuple(VALUE_TOKEN_RE.findall(chunk))
+        fingerprint = simhash(shingles)
+        mask = (1 << self.width) - 1
+        keys = [(band, (fingerprint >> (band * self.width)) & mask) for band in range(self.bands)]
+        for key in keys:
+            for other, other_shingles, other_values in self.buckets.get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance and values == other_values \
+                        and _jaccard(shingles, other_shingles) >= self.min_jaccard:
+                    return True
+        entry = (fingerprint, shingles, values)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(entry)
+        return False
+
+
+def _jaccard(a, b):
+    return len(a & b) / (len(a | b) or 1)
+
+
+def drop_near_duplicates(chunks, max_distance=SIMHASH_MAX_DISTANCE):
+    # Keeps the first chunk of each group of near-duplicates
+    seen = NearDuplicateFilter(max_distance)
+    return [chunk for chunk in chunks if not seen.is_duplicate(chunk)]
+
+
+# ========== Chunking ==========
+def split_text(text, chunk_size, chunk_overlap, model="gpt-3.5-turbo"):
+    # Full chunking stage for one document: header/footer stripping, token-sized splitting and
+    # near-duplicate removal. Counts are reported to the enclosing metrics span.
+    pages, removed = strip_repeated_lines(text.split(PAGE_SEPARATOR))
+    chunks = get_splitter(chunk_size, chunk_overlap, model).split_text("\n\n".join(pages))
+    unique = drop_near_duplicates(chunks)
+    metrics.count("header_lines_removed", removed)
+    metrics.count("duplicate_chunks", len(chunks) - len(unique))
+    return unique
+
+
+def iter_chunks(records, chunk_size=800, chunk_overlap=80, model="gpt-3.5-turbo"):
+    # Consumes (page_number, text, source) records page by page, so the full
+    # document never has to be held in memory. Chunks keep their page number.
+    # Near-duplicates of earlier chunks are skipped; headers are not stripped, since
+    # that needs the other pages.
+    from langchain.schema import Document
+
+    splitter = get_splitter(chunk_size, chunk_overlap, model)
+    seen = NearDuplicateFilter()
+    for page_number, text, source in records:
+        for chunk in splitter.split_text(text):
+            if seen.is_duplicate(chunk):
+                continue
+            yield Document(page_content=chunk, metadata={"page": page_number, "source": source})
@@ -0,0 +1,116 @@
+# doc_buffer.py
+# One read-only byte buffer type that every extractor accepts. Uploads and email attachments stay
+# in memory as the bytes object they arrived in; large files on disk are memory-mapped. Hashing,
+# PDF parsing, DOCX (zip) reading and PIL all read from the buffer directly, so a document is
+# never copied to a temporary file or read into a second bytes object.
+import io
+import os
+import mmap
+
+
+# ========== Configuration ==========
+DOC_MMAP_MIN_BYTES = int(os.getenv("DOC_MMAP_MIN_BYTES", str(4 * 1024 * 1024)))  # smaller files are just read
+
+
+class _ViewReader(io.RawIOBase):
+    # Seekable file object over a memoryview; each reader has its own position
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class DocumentBuffer:
+    def __init__(self, data, name=None, path=None):
+        self.data = data  # bytes, memoryview or mmap
+        self.name = name
+        self.path = path  # set when the bytes come from a file on disk
+
+    @classmethod
+    def from_path(cls, path, name=None):
+        name = name or os.path.basename(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size >= DOC_MMAP_MIN_BYTES:
+                # Pages are loaded on demand by the OS and shared with the page cache
+                return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), name, path)
+            return cls(f.read(), name, path)
+
+    @classmethod
+    def from_file(cls, file, name=None):
+        name = name or getattr(file, "name", None)
+        if isinstance(file, io.BufferedReader) and os.path.isfile(file.name):
+            return cls.from_path(file.name, os.path.basename(name))
+        if hasattr(file, "getvalue"):
+            # BytesIO (and Streamlit's UploadedFile) hand back their bytes object without copying it
+            return cls(file.getvalue(), name)
+        file.seek(0)
+        return cls(file.read(), name)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def view(self):
+        return memoryview(self.data)
+
+    def reader(self):
+        # A fresh file object positioned at 0, for libraries that want one (PIL, zipfile)
+        if isinstance(self.data, bytes):
+            return io.BytesIO(self.data)  # shares the bytes object until written to
+        return io.BufferedReader(_ViewReader(self.view))
+
+    def text(self, encoding="utf-8"):
+        return str(self.data, encoding)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                pass  # a reader still holds a view; the mapping goes away with it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def as_buffer(source, name=None):
+    # Accepts a DocumentBuffer, bytes-like object, path or file object
+    if isinstance(source, DocumentBuffer):
+        return source
+    if isinstance(source, (bytes, memoryview)):
+        return DocumentBuffer(source, name)
+    if isinstance(source, bytearray):
+        return DocumentBuffer(bytes(source), name)
+    if isinstance(source, (str, os.PathLike)):
+        return DocumentBuffer.from_path(os.fspath(source), name)
+    return DocumentBuffer.from_file(source, name)
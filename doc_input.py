@@ -1,23 +1,26 @@
-import os
-import tempfile
-import streamlit as st
-from PIL import Image
-from dotenv import load_dotenv
+from functools import lru_cache
 
-import pytesseract
-import fitz  # PyMuPDF
-import docx2txt
+from doc_buffer import as_buffer
+from ocr_engine import iter_pdf_pages, ocr_settings, prepare_image, OCR_LANG
+from text_cache import cached_extract
+import metrics
 
+# PIL, pytesseract and docx2txt are imported on first use, so importing this module (on every
+# Streamlit page load, in batch and email workers) stays cheap. The OpenAI key check lives with
+# the pages that need the key.
 
 
 # ========== Configuration ==========
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"  # Windows path
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
+TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"  # Windows path
+
+
+@lru_cache(maxsize=None)
+def _tesseract():
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
 
-if not openai_api_key:
-    st.error("⚠️ OpenAI API key not found in environment.")
-    st.stop()
 
 # ========== Extraction Functions ==========
 import mimetypes
@@ -38,22 +41,28 @@ def extract_text1(file_storage):
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
 
-def extract_text_with_filename(file_path, filename):
+def extract_text_with_filename(source, filename):
+    # `source` is a path, bytes (e.g. an email attachment held in memory) or a DocumentBuffer
     file_type, _ = mimetypes.guess_type(filename)
     file_type = file_type or "application/octet-stream"
 
-    with open(file_path, "rb") as file:
+    doc = as_buffer(source, filename)
+    try:
         if file_type in ["image/jpeg", "image/png", "image/jpg"]:
-            return {"text": extract_text_from_image(file)}
+            return {"text": _extract_cached(doc, file_type, extract_text_from_image)}
         elif file_type == "application/pdf":
-            return {"text": extract_text_from_pdf(file)}
+            return {"text": _extract_cached(doc, file_type, extract_text_from_pdf)}
         elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return {"text": extract_text_from_docx(file)}
+            return {"text": _extract_cached(doc, file_type, extract_text_from_docx)}
+        elif file_type == "text/plain":
+            return {"text": extract_text_from_txt(doc)}
         else:
             return {"error": f"Unsupported file type: {file_type}"}
+    finally:
+        if doc is not source:
+            doc.close()
 
 import mimetypes
-import os
 
 def extract_text(file, filename=None):
     # Try getting file type from filename
@@ -65,56 +74,96 @@ def extract_text(file, filename=None):
     if not file_type:
         raise ValueError("Cannot determine file type: missing content_type and filename")
 
-    if file_type in ["image/jpeg", "image/png", "image/jpg"]:
-        return extract_text_from_image(file)
-    elif file_type == "text/plain":
-        return extract_text_from_txt(file)
-    elif file_type == "application/pdf":
-        return extract_text_from_pdf(file)
-    elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return extract_text_from_docx(file)
-    else:
-        raise ValueError(f"Unsupported file type: {file_type}")
+    doc = as_buffer(file, filename)
+    try:
+        if file_type in ["image/jpeg", "image/png", "image/jpg"]:
+            return _extract_cached(doc, file_type, extract_text_from_image)
+        elif file_type == "text/plain":
+            return extract_text_from_txt(doc)
+        elif file_type == "application/pdf":
+            return _extract_cached(doc, file_type, extract_text_from_pdf)
+        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+            return _extract_cached(doc, file_type, extract_text_from_docx)
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+    finally:
+        if doc is not file:
+            doc.close()
+
 
+def _extract_cached(file, file_type, extractor):
+    # Settings that change the extracted text are part of the cache key
+    settings = {"file_type": file_type, "page_separator": "\f", **ocr_settings()}
+    with metrics.span("extract", file_type=file_type):
+        return cached_extract(file, settings, extractor)
 
+
+# Each extractor closes the buffer it creates (an mmap for large files on disk); a buffer passed
+# in belongs to the caller.
 def extract_text_from_image(file):
+    doc = as_buffer(file)
     try:
-        image = Image.open(file).convert('RGB')
-        return pytesseract.image_to_string(image)
+        from PIL import Image
+
+        with doc.reader() as reader:
+            image = prepare_image(Image.open(reader))
+        if image is None:
+            return ""  # blank image
+        return _tesseract().image_to_string(image, lang=OCR_LANG)
     except Exception as e:
         return f"[Error extracting image text] {e}"
+    finally:
+        if doc is not file:
+            doc.close()
+
+def _pdf_source(doc):
+    # Files from disk are handed to PyMuPDF (and the OCR workers) by path instead of as bytes
+    if doc.path:
+        return doc.path
+    return doc.data if isinstance(doc.data, bytes) else bytes(doc.view)
+
+def iter_pdf_text(file):
+    # Yields (page_number, text, source) one page at a time; source is "text", "ocr" or "blank"
+    doc = as_buffer(file)
+    try:
+        for page_number, text, source in iter_pdf_pages(_pdf_source(doc), tesseract_cmd=TESSERACT_CMD):
+            metrics.count("pages")
+            metrics.count(f"{source}_pages")
+            yield page_number, text, source
+    finally:
+        if doc is not file:
+            doc.close()
 
 def extract_text_from_pdf(file):
-    pdf_text = ""
     try:
-        with fitz.open(stream=file.read(), filetype="pdf") as doc:
-            for page in doc:
-                text = page.get_text()
-                if text.strip():
-                    pdf_text += text
-                else:
-                    pix = page.get_pixmap(dpi=300)
-                    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    pdf_text += pytesseract.image_to_string(image)
+        # Pages are separated by form feeds, which chunking uses to find repeated headers/footers
+        return "\f".join(text.rstrip("\f") for _, text, _ in iter_pdf_text(file))
     except Exception as e:
         return f"[Error extracting PDF text] {e}"
-    return pdf_text
 
 def extract_text_from_docx(file):
+    doc = as_buffer(file)
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
-        text = docx2txt.process(tmp_path)
-        os.unlink(tmp_path)
-        return text
+        import docx2txt
+
+        # docx2txt opens the document with zipfile, which reads straight from a file object
+        with doc.reader() as reader:
+            return docx2txt.process(reader)
     except Exception as e:
         return f"[Error extracting DOCX text] {e}"
+    finally:
+        if doc is not file:
+            doc.close()
+
 def extract_text_from_txt(file):
+    doc = as_buffer(file)
     try:
-        return file.read().decode("utf-8")  # or "latin-1" if encoding issue
+        return doc.text("utf-8")  # or "latin-1" if encoding issue
     except Exception as e:
         return f"[Error extracting TXT text] {e}"
+    finally:
+        if doc is not file:
+            doc.close()
 
 
 
@@ -1,51 +1,345 @@
 # email_handler.py
+# Fetches attachments over IMAP without downloading whole messages: BODYSTRUCTURE is read
+# first, then only the attachment body parts are fetched (one UID FETCH per group of messages
+# with the same attachment layout) and decoded in chunks, in memory or to disk. Authenticated
+# connections are pooled and reused across calls, but only by callers presenting the same
+# credentials they were opened with.
+import io
+import hmac
 import imaplib
-import email
-import tempfile
 import os
+import re
+import hashlib
 import uuid
-# add to a new or existing handler file (like email_handler.py)
-from doc_input import extract_text_with_filename
+import time
+import binascii
+import threading
+from contextlib import contextmanager
+from email.header import decode_header, make_header
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
 
 
-def fetch_email_attachments(imap_server, email_user, email_pass, folder="INBOX", max_emails=5):
-    try:
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(email_user, email_pass)
-        mail.select(folder)
-
-        _, messages = mail.search(None, 'UNSEEN')
-        emails = messages[0].split()[-max_emails:]
-        attachments_info = []
-
-        for msg_id in emails:
-            _, data = mail.fetch(msg_id, '(RFC822)')
-            raw_email = data[0][1]
-            message = email.message_from_bytes(raw_email)
-
-            for part in message.walk():
-                content_disposition = part.get("Content-Disposition", "")
-                if "attachment" in content_disposition:
-                    filename = part.get_filename()
-                    file_data = part.get_payload(decode=True)
-
-                    if filename:
-                        unique_id = str(uuid.uuid4())  # generate a unique ID
-                        temp_path = os.path.join(tempfile.gettempdir(), f"{unique_id}_{filename}")
-                        with open(temp_path, "wb") as f:
-                            f.write(file_data)
-
-                        attachments_info.append({
-                            "id": unique_id,
-                            "filename": filename,
-                            "temp_path": temp_path
-                        })
+IMAP_POOL_SIZE = 4            # idle connections kept per (server, user, credentials)
+IMAP_IDLE_SECONDS = 300       # idle connections older than this are logged out, not reused
+DECODE_CHUNK_BYTES = 64 * 1024
+
+
+# ========== Connection Pool ==========
+_pool = {}
+_pool_lock = threading.Lock()
+# Per-process key for the credential digests in pool keys; never stored or logged
+_pool_secret = os.urandom(32)
+
+
+def _pool_key(imap_server, port, use_ssl, email_user, email_pass):
+    # A pooled session is only handed to a caller whose password matches the one it was opened
+    # with; the key holds an HMAC of the credentials, not the password itself
+    credentials = f"{email_user}\0{email_pass}".encode("utf-8")
+    digest = hmac.new(_pool_secret, credentials, hashlib.sha256).hexdigest()
+    return (imap_server, port, use_ssl, email_user, digest)
+
+
+def _connect(imap_server, email_user, email_pass, port, use_ssl):
+    if use_ssl:
+        mail = imaplib.IMAP4_SSL(imap_server, port or 993)
+    else:
+        mail = imaplib.IMAP4(imap_server, port or 143)
+    mail.login(email_user, email_pass)
+    return mail
 
+
+def _close(mail):
+    try:
         mail.logout()
+    except Exception:
+        pass
+
+
+def _take_idle(key):
+    # Most recently used idle connection for key, or None. Connections idle for longer than
+    # IMAP_IDLE_SECONDS are logged out rather than revived.
+    now = time.monotonic()
+    with _pool_lock:
+        idle = _pool.get(key, [])
+        expired = [mail for mail, last_used in idle if now - last_used >= IMAP_IDLE_SECONDS]
+        idle[:] = [(mail, last_used) for mail, last_used in idle if now - last_used < IMAP_IDLE_SECONDS]
+        candidate = idle.pop()[0] if idle else None
+    for mail in expired:
+        _close(mail)
+    return candidate
+
+
+@contextmanager
+def imap_connection(imap_server, email_user, email_pass, port=None, use_ssl=True):
+    key = _pool_key(imap_server, port, use_ssl, email_user, email_pass)
+    mail = _take_idle(key)
+    if mail is None:
+        mail = _connect(imap_server, email_user, email_pass, port, use_ssl)
+
+    broken = False
+    try:
+        yield mail
+    except (imaplib.IMAP4.abort, OSError):
+        # The connection is unusable; drop it instead of returning it to the pool
+        broken = True
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+        raise
+    finally:
+        if not broken and not _released(key, mail):
+            mail.logout()
+
+
+def _released(key, mail):
+    with _pool_lock:
+        idle = _pool.setdefault(key, [])
+        if len(idle) < IMAP_POOL_SIZE:
+            idle.append((mail, time.monotonic()))
+            return True
+    return False
+
+
+# ========== BODYSTRUCTURE Parsing ==========
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+
+
+def _tokenize(data):
+    # imaplib returns literals as (prefix, literal) tuples; literals become plain string tokens
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            prefix, literal = item
+            tokens.extend(_tokenize_bytes(_LITERAL_RE.sub(b"", prefix)))
+            tokens.append(("str", literal.decode("utf-8", "replace")))
+        elif item:
+            tokens.extend(_tokenize_bytes(item))
+    return tokens
+
+
+def _tokenize_bytes(data):
+    tokens = []
+    pos = 0
+    data = data.rstrip()
+    while pos < len(data):
+        match = _TOKEN_RE.match(data, pos)
+        if not match:
+            break
+        pos = match.end()
+        open_paren, close_paren, quoted, atom = match.groups()
+        if open_paren:
+            tokens.append(("(", None))
+        elif close_paren:
+            tokens.append((")", None))
+        elif quoted is not None:
+            tokens.append(("str", re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", "replace")))
+        else:
+            value = atom.decode("utf-8", "replace")
+            tokens.append(("str", None if value.upper() == "NIL" else value))
+    return tokens
+
+
+def _parse(tokens):
+    # Nested lists of strings/None, one top-level item per token group
+    stack = [[]]
+    for kind, value in tokens:
+        if kind == "(":
+            stack.append([])
+        elif kind == ")":
+            if len(stack) > 1:
+                finished = stack.pop()
+                stack[-1].append(finished)
+        else:
+            stack[-1].append(value)
+    return stack[0]
+
+
+def _fetch_items(data):
+    # "* 3 FETCH (UID 17 BODYSTRUCTURE (...))" -> {"UID": "17", "BODYSTRUCTURE": [...]}
+    parsed = _parse(_tokenize(data))
+    messages = []
+    for item in parsed:
+        if isinstance(item, list):
+            messages.append({str(item[i]).upper(): item[i + 1] for i in range(0, len(item) - 1, 2)})
+    return messages
+
+
+def _params(values):
+    if not isinstance(values, list):
+        return {}
+    return {str(values[i]).lower(): values[i + 1] for i in range(0, len(values) - 1, 2)}
+
+
+def _decode_filename(params):
+    if "filename*" in params or "name*" in params:
+        raw = params.get("filename*") or params.get("name*")
+        # charset'language'percent-encoded-text
+        charset, _, text = decode_rfc2231(raw)
+        return unquote(text, encoding=charset or "utf-8", errors="replace")
+    name = params.get("filename") or params.get("name")
+    if name:
+        return str(make_header(decode_header(name)))
+    return None
+
+
+def _iter_parts(body, part_id=""):
+    if isinstance(body[0], list):
+        index = 0
+        for child in body:
+            if not isinstance(child, list):
+                break  # the subtype and extension data follow the children
+            index += 1
+            yield from _iter_parts(child, f"{part_id}.{index}" if part_id else str(index))
+        return
+
+    part_id = part_id or "1"
+    yield part_id, body
+    if str(body[0]).lower() == "message" and str(body[1]).lower() == "rfc822" \
+            and len(body) > 8 and isinstance(body[8], list):
+        inner = body[8]
+        yield from _iter_parts(inner, part_id if isinstance(inner[0], list) else f"{part_id}.1")
+
+
+def attachment_parts(structure):
+    # Yields (part_id, filename, transfer_encoding, size) for every attachment part
+    for part_id, body in _iter_parts(structure):
+        media_type = str(body[0]).lower()
+        media_subtype = str(body[1]).lower()
+        if media_type == "text":
+            disposition_index = 9
+        elif media_type == "message" and media_subtype == "rfc822":
+            disposition_index = 11
+        else:
+            disposition_index = 8
+
+        disposition = body[disposition_index] if len(body) > disposition_index else None
+        if not isinstance(disposition, list) or str(disposition[0]).lower() != "attachment":
+            continue
+
+        params = _params(body[2])
+        params.update(_params(disposition[1] if len(disposition) > 1 else None))
+        filename = _decode_filename(params)
+        if filename:
+            yield part_id, filename, str(body[5] or "7bit").lower(), int(body[6] or 0)
+
+
+# ========== Part Fetching ==========
+_SECTION_RE = re.compile(rb"BODY\[([\d.]+)\](?:<\d+>)? \{\d+\}$")
+_UID_RE = re.compile(rb"UID (\d+)")
+
+
+def _iter_fetched_parts(data):
+    # Yields (uid, part_id, literal) from a UID FETCH of BODY.PEEK[...] sections
+    uid = None
+    pending = []
+    for item in data:
+        if isinstance(item, tuple):
+            prefix, literal = item
+            if re.match(rb"\d+ \(", prefix):
+                uid = None
+            found = _UID_RE.search(prefix)
+            if found:
+                uid = found.group(1).decode()
+            section = _SECTION_RE.search(prefix)
+            if section:
+                pending.append((section.group(1).decode(), literal))
+        elif isinstance(item, bytes):
+            found = _UID_RE.search(item)
+            if found:
+                uid = found.group(1).decode()
+            if item.rstrip().endswith(b")"):
+                for part_id, literal in pending:
+                    yield uid, part_id, literal
+                pending = []
+
+
+def _write_decoded(literal, encoding, f):
+    # Decodes the transfer encoding slice by slice into the binary file object f, so no second
+    # encoded copy is built up in memory
+    view = memoryview(literal)
+    if encoding == "base64":
+        carry = b""
+        for start in range(0, len(view), DECODE_CHUNK_BYTES):
+            chunk = carry + re.sub(rb"[^A-Za-z0-9+/=]", b"", view[start:start + DECODE_CHUNK_BYTES])
+            usable = len(chunk) - len(chunk) % 4
+            f.write(binascii.a2b_base64(chunk[:usable]))
+            carry = chunk[usable:]
+        if carry:
+            f.write(binascii.a2b_base64(carry + b"=" * (-len(carry) % 4)))
+    elif encoding == "quoted-printable":
+        carry = b""
+        for start in range(0, len(view), DECODE_CHUNK_BYTES):
+            chunk = carry + bytes(view[start:start + DECODE_CHUNK_BYTES])
+            cut = chunk.rfind(b"\n") + 1
+            f.write(binascii.a2b_qp(chunk[:cut]))
+            carry = chunk[cut:]
+        f.write(binascii.a2b_qp(carry))
+    else:
+        for start in range(0, len(view), DECODE_CHUNK_BYTES):
+            f.write(view[start:start + DECODE_CHUNK_BYTES])
+
+
+def fetch_attachments_for_uids(mail, uids, dest_dir=None):
+    # Downloads the attachments of the given UIDs from the selected folder. With dest_dir they are
+    # written there and returned with a "temp_path" (the ingestion queue needs durable files);
+    # without it they are decoded in memory and returned with their bytes under "data".
+    if not uids:
+        return []
+
+    _, data = mail.uid("FETCH", ",".join(uids), "(UID BODYSTRUCTURE)")
+    parts_by_uid = {}
+    for message in _fetch_items(data):
+        if "UID" in message and isinstance(message.get("BODYSTRUCTURE"), list):
+            parts_by_uid[message["UID"]] = list(attachment_parts(message["BODYSTRUCTURE"]))
+
+    # Messages with the same attachment sections share one FETCH command
+    groups = {}
+    for uid in uids:
+        parts = parts_by_uid.get(uid)
+        if parts:
+            groups.setdefault(tuple(part_id for part_id, _, _, _ in parts), []).append(uid)
+
+    attachments_info = []
+    for sections, group_uids in groups.items():
+        items = " ".join(f"BODY.PEEK[{section}]" for section in sections)
+        _, data = mail.uid("FETCH", ",".join(group_uids), f"(UID {items})")
+        for uid, part_id, literal in _iter_fetched_parts(data):
+            part = next((p for p in parts_by_uid.get(uid, []) if p[0] == part_id), None)
+            if part is None:
+                continue
+            _, filename, encoding, _ = part
+            unique_id = str(uuid.uuid4())  # generate a unique ID
+            info = {"id": unique_id, "uid": uid, "filename": filename}
+            if dest_dir:
+                info["temp_path"] = os.path.join(dest_dir, f"{unique_id}_{os.path.basename(filename)}")
+                with open(info["temp_path"], "wb") as f:
+                    _write_decoded(literal, encoding, f)
+            else:
+                buffer = io.BytesIO()
+                _write_decoded(literal, encoding, buffer)
+                info["data"] = buffer.getvalue()
+            attachments_info.append(info)
+    return attachments_info
+
+
+def fetch_email_attachments(imap_server, email_user, email_pass, folder="INBOX", max_emails=5,
+                            port=None, use_ssl=True):
+    try:
+        with imap_connection(imap_server, email_user, email_pass, port=port, use_ssl=use_ssl) as mail:
+            mail.select(folder)
+
+            _, messages = mail.uid("SEARCH", None, "UNSEEN")
+            uids = [uid.decode() for uid in messages[0].split()[-max_emails:]]
+            attachments_info = fetch_attachments_for_uids(mail, uids)
+
+            # Parts are fetched with BODY.PEEK, so mark the messages read explicitly
+            if uids:
+                mail.uid("STORE", ",".join(uids), "+FLAGS", "(\\Seen)")
+
         return attachments_info
 
     except Exception as e:
         return [{"error": str(e)}]
-    
-
-    
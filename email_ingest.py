@@ -0,0 +1,253 @@
+# email_ingest.py
+# Long-running mailbox ingestion: polls an IMAP folder past a UIDVALIDITY/UID high-water mark,
+# enqueues every new attachment in a durable SQLite job queue and feeds a pool of
+# extract_text_with_filename workers with retries, backoff and dead-lettering.
+#
+#   EMAIL_USER=... EMAIL_PASS=... python email_ingest.py --server imap.gmail.com --workers 4
+#
+# Polling pauses while the queue holds --max-pending unfinished jobs (backpressure), so a burst
+# of mail is absorbed at the rate the workers can sustain. Extracted text is stored on the job row.
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from email_handler import imap_connection, fetch_attachments_for_uids
+
+INGEST_DB = os.getenv("INGEST_DB", os.path.join(".cache", "email_ingest.sqlite"))
+INGEST_DIR = os.getenv("INGEST_DIR", os.path.join(".cache", "attachments"))
+
+
+# ========== Job Store ==========
+def connect(path=INGEST_DB):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS mailbox_state (
+            mailbox TEXT PRIMARY KEY, uidvalidity INTEGER NOT NULL, last_uid INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY, mailbox TEXT NOT NULL, uid INTEGER NOT NULL,
+            filename TEXT NOT NULL, path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done | dead
+            attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0,
+            error TEXT, text TEXT, created REAL NOT NULL, updated REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, next_attempt);
+        """
+    )
+    return conn
+
+
+def backlog(conn):
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+
+
+def recover(conn):
+    # Jobs that were running when the previous process died go back to the queue, and attachment
+    # files no unfinished job refers to (left by a poll that died before its enqueue committed)
+    # are deleted
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+    if not os.path.isdir(INGEST_DIR):
+        return
+    referenced = {os.path.abspath(row[0]) for row in conn.execute("SELECT path FROM jobs WHERE status != 'done'")}
+    for name in os.listdir(INGEST_DIR):
+        path = os.path.abspath(os.path.join(INGEST_DIR, name))
+        if path not in referenced and os.path.isfile(path):
+            os.unlink(path)
+
+
+def requeue_dead(conn):
+    with conn:
+        return conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, next_attempt = 0 WHERE status = 'dead'"
+        ).rowcount
+
+
+# ========== Polling ==========
+def _uidvalidity(mail, folder):
+    _, data = mail.response("UIDVALIDITY")
+    if data and data[0]:
+        return int(data[0])
+    _, data = mail.status(folder, "(UIDVALIDITY)")
+    return int(data[0].split(b"UIDVALIDITY")[1].strip(b" ()"))
+
+
+def poll(conn, mail, folder, limit):
+    # Enqueues attachments of up to `limit` messages above the high-water mark; returns jobs added
+    mail.select(folder, readonly=True)
+    uidvalidity = _uidvalidity(mail, folder)
+
+    row = conn.execute("SELECT uidvalidity, last_uid FROM mailbox_state WHERE mailbox = ?", (folder,)).fetchone()
+    last_uid = 0
+    if row and row["uidvalidity"] == uidvalidity:
+        last_uid = row["last_uid"]
+    # A changed UIDVALIDITY means the server renumbered the folder, so it is scanned again from UID 1
+
+    _, data = mail.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+    # "n:*" always matches the newest message, even when its UID is below n
+    uids = sorted(uid for uid in map(int, data[0].split()) if uid > last_uid)[:limit]
+    if not uids:
+        return 0
+
+    os.makedirs(INGEST_DIR, exist_ok=True)
+    attachments = fetch_attachments_for_uids(mail, [str(uid) for uid in uids], dest_dir=INGEST_DIR)
+
+    now = time.time()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO jobs(mailbox, uid, filename, path, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                [(folder, int(att["uid"]), att["filename"], att["temp_path"], now, now) for att in attachments],
+            )
+            # The high-water mark moves in the same transaction as the enqueue, so no UID is lost or doubled
+            conn.execute(
+                "INSERT OR REPLACE INTO mailbox_state(mailbox, uidvalidity, last_uid) VALUES (?, ?, ?)",
+                (folder, uidvalidity, uids[-1]),
+            )
+    except BaseException:
+        # Nothing refers to the files once the enqueue is rolled back; the next poll fetches them again
+        for att in attachments:
+            if os.path.exists(att["temp_path"]):
+                os.unlink(att["temp_path"])
+        raise
+    return len(attachments)
+
+
+# ========== Workers ==========
+def extract_job(path, filename):
+    from doc_input import extract_text_with_filename
+
+    result = extract_text_with_filename(path, filename)
+    text = result.get("text", "")
+    if "error" in result or text.startswith("[Error"):
+        raise RuntimeError(result.get("error") or text)
+    return text
+
+
+def poll_limit(conn, max_pending, batch_size):
+    # Messages to fetch in the next poll: none while the backlog is at max_pending (backpressure)
+    return max(0, min(max_pending - backlog(conn), batch_size))
+
+
+def claim(conn, limit):
+    now = time.time()
+    jobs = conn.execute(
+        "SELECT id, filename, path FROM jobs WHERE status = 'pending' AND next_attempt <= ?"
+        " ORDER BY id LIMIT ?",
+        (now, limit),
+    ).fetchall()
+    with conn:
+        conn.executemany(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE id = ?",
+            [(now, job["id"]) for job in jobs],
+        )
+    return jobs
+
+
+def finish(conn, job_id, path, text=None, error=None, max_attempts=3):
+    now = time.time()
+    with conn:
+        if error is None:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', text = ?, error = NULL, updated = ? WHERE id = ?",
+                (text, now, job_id),
+            )
+        else:
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if attempts >= max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', error = ?, updated = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+                return
+            # Exponential backoff: 30s, 60s, 120s, ...
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', error = ?, next_attempt = ?, updated = ? WHERE id = ?",
+                (error, now + 30 * 2 ** (attempts - 1), now, job_id),
+            )
+            return
+    # The attachment is only needed until its text is stored
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def run(args, email_user, email_pass):
+    conn = connect()
+    recover(conn)
+
+    in_flight = {}
+    next_poll = 0.0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            if time.monotonic() >= next_poll:
+                next_poll = float("inf") if args.once else time.monotonic() + args.poll_interval
+                limit = poll_limit(conn, args.max_pending, args.batch_size)
+                if limit:
+                    try:
+                        with imap_connection(args.server, email_user, email_pass,
+                                             port=args.port, use_ssl=not args.no_ssl) as mail:
+                            added = poll(conn, mail, args.folder, limit)
+                        if added:
+                            print(f"Enqueued {added} attachments")
+                    except Exception as e:
+                        print(f"Poll failed: {e}")
+
+            for job in claim(conn, args.workers - len(in_flight)):
+                future = pool.submit(extract_job, job["path"], job["filename"])
+                in_flight[future] = job
+
+            if not in_flight:
+                if args.once and backlog(conn) == 0:
+                    break
+                time.sleep(1)
+                continue
+
+            done, _ = wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                try:
+                    finish(conn, job["id"], job["path"], text=future.result())
+                    print(f"Extracted {job['filename']}")
+                except Exception as e:
+                    finish(conn, job["id"], job["path"], error=str(e), max_attempts=args.max_attempts)
+                    print(f"Failed {job['filename']}: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Continuously ingest email attachments.")
+    parser.add_argument("--server", default="imap.gmail.com")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--no-ssl", action="store_true", help="Plain IMAP, e.g. for a local test server")
+    parser.add_argument("--folder", default="INBOX")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Seconds between mailbox polls")
+    parser.add_argument("--batch-size", type=int, default=50, help="Messages fetched per poll")
+    parser.add_argument("--max-pending", type=int, default=200, help="Stop polling above this backlog")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts before a job is dead-lettered")
+    parser.add_argument("--once", action="store_true", help="Poll once, drain the queue and exit")
+    parser.add_argument("--retry-dead", action="store_true", help="Move dead-lettered jobs back to the queue")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    email_user = os.getenv("EMAIL_USER")
+    email_pass = os.getenv("EMAIL_PASS")
+    if not email_user or not email_pass:
+        parser.error("EMAIL_USER and EMAIL_PASS must be set")
+
+    if args.retry_dead:
+        print(f"Requeued {requeue_dead(connect())} dead jobs")
+
+    # Parallelism comes from the job pool; each worker OCRs its own pages serially
+    os.environ.setdefault("OCR_WORKERS", "1")
+    run(args, email_user, email_pass)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
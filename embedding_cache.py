@@ -0,0 +1,154 @@
+# embedding_cache.py
+# Chunk-level embedding cache. Vectors are stored as float32 blobs keyed by (model, sha256(chunk)),
+# so repeated chunks (boilerplate clauses, invoice headers, resume templates) are embedded once.
+import os
+import array
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+
+import metrics
+
+
+# ========== Configuration ==========
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # openai | local | stub
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+# ========== Embedders ==========
+class HashEmbeddings:
+    # Deterministic offline stub: hashed bag-of-words vectors, no model or network needed
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.model = f"stub-hash-{dim}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in text.lower().split():
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class LocalEmbeddings:
+    # sentence-transformers model run in-process
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = model_name
+        self._model = SentenceTransformer(model_name)
+
+    def embed_documents(self, texts):
+        return self._model.encode(list(texts), convert_to_numpy=True).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# ========== Cache ==========
+class CachedEmbeddings:
+    # Wraps any embedder with embed_documents/embed_query; only cache misses reach it, in batches.
+    def __init__(self, embedder, path=EMBEDDING_CACHE_PATH, batch_size=EMBEDDING_BATCH_SIZE):
+        self.embedder = embedder
+        self.model = getattr(embedder, "model", type(embedder).__name__)
+        self.path = path
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        return conn
+
+    def embed_documents(self, texts):
+        with metrics.span("embedding", model=self.model):
+            return self._embed_documents(list(texts))
+
+    def _embed_documents(self, texts):
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        vectors = {}
+
+        conn = self._connect()
+        try:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [self.model] + batch,
+                ).fetchall()
+                for h, blob in rows:
+                    vectors[h] = array.array("f", blob).tolist()
+
+            missing = {}
+            for h, text in zip(hashes, texts):
+                if h not in vectors:
+                    missing.setdefault(h, text)
+
+            miss_count = sum(1 for h in hashes if h in missing)
+            with self._lock:
+                self.hits += len(texts) - miss_count
+                self.misses += miss_count
+            metrics.count("texts", len(texts))
+            metrics.count("embedding_cache_hits", len(texts) - miss_count)
+            metrics.count("embedding_cache_misses", miss_count)
+
+            missing = list(missing.items())
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                embedded = self.embedder.embed_documents([text for _, text in batch])
+                metrics.count("embedder_calls")
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings(model, hash, vector) VALUES (?, ?, ?)",
+                        [(self.model, h, array.array("f", vector).tobytes()) for (h, _), vector in zip(batch, embedded)],
+                    )
+                for (h, _), vector in zip(batch, embedded):
+                    vectors[h] = list(vector)
+        finally:
+            conn.close()
+
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text):
+        # Queries are rarely repeated verbatim, so they go straight to the embedder
+        return self.embedder.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def get_embeddings(backend=None):
+    return _get_embeddings(backend or EMBEDDING_BACKEND)
+
+
+@lru_cache(maxsize=None)
+def _get_embeddings(backend):
+    # One embedder (model weights, HTTP client) per backend for the whole process
+    if backend == "stub":
+        embedder = HashEmbeddings()
+    elif backend == "local":
+        embedder = LocalEmbeddings()
+    else:
+        from langchain.embeddings import OpenAIEmbeddings
+
+        embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return CachedEmbeddings(embedder)
@@ -0,0 +1,229 @@
+# exporter.py
+# Streaming export of extracted rows to CSV, JSON, JSONL, Parquet and Excel. Rows arrive as an
+# iterable of batches (lists of dicts) and each batch is written before the next is read, so an
+# export never holds more than one batch besides the writer's own buffers (Parquet spools rows to a
+# temporary file first, since its column types depend on every row). The pages build their
+# downloads only when asked; batch runs merge the per-document JSONL records into one file.
+import io
+import os
+import csv
+import json
+import tempfile
+import textwrap
+
+
+# ========== Configuration ==========
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+
+
+# ========== Row Sources ==========
+def frame_batches(df, batch_size=EXPORT_BATCH_ROWS):
+    # DataFrame rows as dicts, one slice at a time; missing values become None
+    for start in range(0, len(df), batch_size):
+        part = df.iloc[start:start + batch_size]
+        yield part.astype(object).where(part.notna(), None).to_dict(orient="records")
+
+
+def batch_result_rows(progress_path, batch_size=EXPORT_BATCH_ROWS):
+    # Flattens a batch_extract JSONL file into one row per extracted entry. Returns
+    # (columns, batches). The first pass keeps only each document's latest line offset and the
+    # column names, so a retried document appears once and memory stays bounded by the number of
+    # documents rather than their entries.
+    latest = {}
+    columns = {"path": None, "status": None, "error": None, "total_seconds": None}
+    with open(progress_path, "rb") as f:
+        for offset, line in _lines_with_offsets(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[record["document_id"]] = offset
+            for entry in record.get("entries") or ():
+                columns.update(dict.fromkeys(entry))
+
+    def batches():
+        batch = []
+        with open(progress_path, "rb") as f:
+            for offset in sorted(latest.values()):
+                f.seek(offset)
+                record = json.loads(f.readline())
+                for entry in record.get("entries") or [{}]:
+                    batch.append({
+                        "path": record["path"],
+                        "status": record["status"],
+                        "error": record.get("error", ""),
+                        "total_seconds": record["timings"].get("total"),
+                        **entry,
+                    })
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    return list(columns), batches()
+
+
+def _lines_with_offsets(f):
+    offset = 0
+    for line in f:
+        yield offset, line
+        offset += len(line)
+
+
+# ========== Writers ==========
+# Each writer takes (batches, binary file object, columns). `columns` fixes the column order;
+# keys missing from a row are written empty and keys not in `columns` are dropped.
+def write_csv(batches, f, columns):
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=columns, restval="", extrasaction="ignore")
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+    text.flush()
+    text.detach()  # leave the underlying file open for the caller
+
+
+def write_jsonl(batches, f, columns):
+    for batch in batches:
+        lines = (json.dumps({c: row.get(c) for c in columns}, ensure_ascii=False, default=str) for row in batch)
+        f.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def write_json(batches, f, columns):
+    # Same text as json.dumps(rows, indent=4), written a row at a time
+    f.write(b"[")
+    first = True
+    for batch in batches:
+        for row in batch:
+            item = json.dumps({c: row.get(c) for c in columns}, indent=4, default=str)
+            f.write(((",\n" if not first else "\n") + textwrap.indent(item, "    ")).encode("utf-8"))
+            first = False
+    f.write(b"\n]" if not first else b"]")
+
+
+def write_parquet(batches, f, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # A column is numeric only if every value in it is, and that is known only after the last
+    # row. The first pass spools the rows to a temporary file while checking; the second writes
+    # them in batches. Columns with any text in them are written as text, so no value is lost.
+    numeric = dict.fromkeys(columns)  # None until the column's first value
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        for batch in batches:
+            for row in batch:
+                values = [row.get(c) for c in columns]
+                for column, value in zip(columns, values):
+                    if value is not None and numeric[column] is not False:
+                        numeric[column] = _is_number(value)
+                spool.write(json.dumps(values, ensure_ascii=False, default=str) + "\n")
+
+        schema = pa.schema([pa.field(c, pa.float64() if numeric[c] is True else pa.string()) for c in columns])
+        spool.seek(0)
+        writer = pq.ParquetWriter(f, schema)
+        try:
+            rows = []
+            for line in spool:
+                rows.append(json.loads(line))
+                if len(rows) >= EXPORT_BATCH_ROWS:
+                    writer.write_table(_arrow_table(pa, schema, rows))
+                    rows = []
+            if rows:
+                writer.write_table(_arrow_table(pa, schema, rows))
+        finally:
+            writer.close()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _arrow_table(pa, schema, rows):
+    return pa.Table.from_pydict(
+        {field.name: [_arrow_value(field, row[i]) for row in rows] for i, field in enumerate(schema)},
+        schema=schema,
+    )
+
+
+def _arrow_value(field, value):
+    if value is None:
+        return None
+    if str(field.type) == "double":
+        return float(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def write_excel(batches, f, columns):
+    import xlsxwriter
+
+    # constant_memory flushes each row to disk as it is written
+    workbook = xlsxwriter.Workbook(f, {"constant_memory": True})
+    sheet = workbook.add_worksheet("Sheet1")
+    sheet.write_row(0, 0, columns)
+    row_number = 1
+    for batch in batches:
+        for row in batch:
+            sheet.write_row(row_number, 0, [_cell(row.get(c)) for c in columns])
+            row_number += 1
+    workbook.close()
+
+
+def _cell(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+FORMATS = {
+    "csv": {"extension": ".csv", "mime": "text/csv", "writer": write_csv},
+    "json": {"extension": ".json", "mime": "application/json", "writer": write_json},
+    "jsonl": {"extension": ".jsonl", "mime": "application/x-ndjson", "writer": write_jsonl},
+    "parquet": {"extension": ".parquet", "mime": "application/vnd.apache.parquet", "writer": write_parquet},
+    "excel": {
+        "extension": ".xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "writer": write_excel,
+    },
+}
+
+
+# ========== Public API ==========
+def format_for_path(path):
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, spec in FORMATS.items():
+        if spec["extension"] == extension:
+            return fmt
+    raise ValueError(f"No export format for '{extension}' files")
+
+
+def export(batches, columns, path, fmt=None):
+    # Written to a temporary file first, so an interrupted export never leaves a truncated file
+    fmt = fmt or format_for_path(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            FORMATS[fmt]["writer"](batches, f, list(columns))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_bytes(batches, columns, fmt):
+    # For download buttons
+    buffer = io.BytesIO()
+    FORMATS[fmt]["writer"](batches, buffer, list(columns))
+    return buffer.getvalue()
+
+
+def export_frame(df, fmt):
+    return export_bytes(frame_batches(df), list(df.columns), fmt)
+
+
+def frame_fingerprint(df):
+    # Cheap content hash, so a prepared download can be dropped once the table is edited
+    import pandas as pd
+
+    return hash((tuple(df.columns), int(pd.util.hash_pandas_object(df, index=False).sum())))
@@ -0,0 +1,129 @@
+# llm_cache.py
+# Persistent cache for LLM completions, keyed by (model, sampling parameters, prompt). Map and
+# reduce prompts embed the retrieved context, so the same query over the same chunks (retries,
+# re-clicks, batch reprocessing) is answered from disk. Only deterministic calls (temperature 0)
+# are cached. Entries live in one SQLite file (WAL mode), expire after LLM_CACHE_TTL and are
+# evicted least recently used first once the cache outgrows LLM_CACHE_MAX_MB.
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+
+
+# ========== Configuration ==========
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds; 0 keeps entries forever
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+
+
+def _connect():
+    os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(LLM_CACHE_DIR, "llm_cache.sqlite"), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " key TEXT PRIMARY KEY, response BLOB NOT NULL, size INTEGER NOT NULL,"
+        " created REAL NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+    return conn
+
+
+# ========== Public API ==========
+def llm_params(llm):
+    # The settings that influence a completion; None when the LLM samples (temperature > 0)
+    temperature = getattr(llm, "temperature", 0) or 0
+    if temperature > 0:
+        return None
+    return {
+        "class": type(llm).__name__,
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "temperature": temperature,
+        "max_tokens": getattr(llm, "max_tokens", None),
+    }
+
+
+def cache_key(params, prompt):
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get(key):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if LLM_CACHE_TTL and now - row[1] > LLM_CACHE_TTL:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return zlib.decompress(row[0]).decode("utf-8")
+    finally:
+        conn.close()
+
+
+def put(key, response):
+    blob = zlib.compress(response.encode("utf-8"))
+    max_bytes = int(LLM_CACHE_MAX_MB * 1024 * 1024)
+    if len(blob) > max_bytes:
+        return
+
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses(key, response, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            if LLM_CACHE_TTL:
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - LLM_CACHE_TTL,))
+            # Evict least recently used entries until the cache fits its size budget
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > max_bytes:
+                for old_key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                    if total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= size
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def lookup(llm, prompt):
+    # Returns (key, cached response). key is None when this call must not be cached; the response
+    # is None on a miss.
+    params = llm_params(llm) if LLM_CACHE_ENABLED else None
+    if params is None:
+        return None, None
+    key = cache_key(params, prompt)
+    return key, get(key)
+
+
+def clear():
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM responses")
+    finally:
+        conn.close()
+
+
+def cache_stats():
+    conn = _connect()
+    try:
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    finally:
+        conn.close()
+    return {"entries": entries, "bytes": size}
@@ -4,6 +4,7 @@ def input():
     import requests
     from doc_input import extract_text, extract_text_with_filename
     from email_handler import fetch_email_attachments
+    import metrics
     
 
     
@@ -19,7 +20,9 @@ def input():
         uploaded_file = st.file_uploader("Upload file", type=["pdf", "docx", "jpg", "jpeg", "png", "txt"])
         if uploaded_file:
             filename = uploaded_file.name
-            text = extract_text(uploaded_file)
+            with metrics.run("input", filename=filename) as run:
+                text = extract_text(uploaded_file)
+            st.session_state["input_metrics"] = run.to_dict()
             st.text_area("Extracted Text", text, height=300)
 
     # Email Fetch Option
@@ -62,7 +65,10 @@ def input():
             index = int(choice.split(".")[0]) - 1
             chosen = attachments[index]
 
-            result = extract_text_with_filename(chosen["temp_path"], chosen["filename"])
+            with metrics.run("input", filename=chosen["filename"]) as run:
+                # Attachments are held in memory, so there are no temp files to read back or clean up
+                result = extract_text_with_filename(chosen["data"], chosen["filename"])
+            st.session_state["input_metrics"] = run.to_dict()
             text=result["text"]
             if "error" in result:
                 st.error(f"❌ Error during extraction: {result['error']}")
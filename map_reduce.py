@@ -0,0 +1,260 @@
+# map_reduce.py
+# Retrieval QA with an asyncio map stage: the per-chunk LLM calls run concurrently under a
+# concurrency cap and a process-wide requests/tokens-per-minute limiter, then one reduce call
+# combines them. Any LLM exposing `apredict(prompt)` works, e.g. ChatOpenAI pointed at a local
+# fake server through OPENAI_API_BASE, or LangChain's FakeListLLM.
+import os
+import time
+import random
+import asyncio
+import threading
+
+import metrics
+import llm_cache
+
+
+# ========== Configuration ==========
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "8"))
+LLM_RPM = int(os.getenv("LLM_RPM", "3500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "90000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_OUTPUT_TOKENS = 256  # budgeted per call on top of the prompt
+
+MAP_PROMPT = (
+    "Use the following portion of a long document to see if any of the text is relevant to answer the question. \n"
+    "Return any relevant text verbatim.\n"
+    "______________________\n"
+    "{context}\n\n"
+    "Question: {question}\n"
+    "Relevant text, if any:"
+)
+
+REDUCE_PROMPT = (
+    "Given the following extracted parts of a long document and a question, create a final answer. \n"
+    "If you don't know the answer, just say that you don't know. Don't try to make up an answer.\n"
+    "______________________\n"
+    "{summaries}\n\n"
+    "Question: {question}"
+)
+
+
+# Small-document path: the whole text goes into one prompt, no retrieval or map step
+STUFF_PROMPT = (
+    "Use the following document to answer the question. \n"
+    "If you don't know the answer, just say that you don't know. Don't try to make up an answer.\n"
+    "______________________\n"
+    "{summaries}\n\n"
+    "Question: {question}"
+)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+# ========== Rate Limiting ==========
+class RateLimiter:
+    # Token buckets for requests/min and tokens/min. State is guarded by a thread lock rather
+    # than an asyncio lock, so one limiter can be shared by every event loop in the process.
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.updated = now
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+            tokens = min(tokens, self.tpm)
+            if self.requests >= 1 and self.tokens >= tokens:
+                self.requests -= 1
+                self.tokens -= tokens
+                return 0.0
+            wait_requests = (1 - self.requests) * 60 / self.rpm
+            wait_tokens = (tokens - self.tokens) * 60 / self.tpm
+            return max(wait_requests, wait_tokens, 0.01)
+
+    async def acquire(self, tokens):
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens):
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+_limiter = RateLimiter()
+
+
+def share_rate_limits(processes):
+    # The limiter only sees this process. When `processes` processes call the API with the same key
+    # (batch_extract workers), each gets an even share of LLM_RPM/LLM_TPM so together they stay
+    # within the account limits. A share left idle by one process is not lent to the others.
+    global _limiter
+    _limiter = RateLimiter(LLM_RPM / processes, LLM_TPM / processes)
+
+
+# ========== Chain ==========
+class AsyncMapReduceQA:
+    # Drop-in for RetrievalQA.from_chain_type(chain_type="map_reduce"): qa({"query": ...}) returns
+    # {"result", "source_documents", "map_outputs"}.
+    reduce_prompt = REDUCE_PROMPT
+
+    def __init__(self, llm, retriever, concurrency=MAP_CONCURRENCY, max_retries=LLM_MAX_RETRIES, limiter=None,
+                 use_cache=True):
+        self.llm = llm
+        self.retriever = retriever
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.limiter = limiter or _limiter
+        self.use_cache = use_cache  # False bypasses llm_cache for both lookups and writes
+
+    def _cache_lookup(self, prompt):
+        # (key, cached completion); key is None when the call is not cacheable or the cache is bypassed
+        if not self.use_cache:
+            return None, None
+        return llm_cache.lookup(self.llm, prompt)
+
+    async def _call_llm(self, prompt):
+        key, cached = self._cache_lookup(prompt)
+        if key is not None:
+            metrics.count("llm_cache_hits" if cached is not None else "llm_cache_misses")
+        if cached is not None:
+            return cached
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimate_tokens(prompt) + LLM_OUTPUT_TOKENS)
+            metrics.count("llm_calls")
+            try:
+                output = await self.llm.apredict(prompt)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                metrics.count("llm_retries")
+                # Exponential backoff with jitter, capped at 30 seconds
+                await asyncio.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+                continue
+            metrics.count("tokens_in", estimate_tokens(prompt))
+            metrics.count("tokens_out", estimate_tokens(output))
+            if key is not None:
+                llm_cache.put(key, output)
+            return output
+
+    async def _amap(self, docs, question):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def map_one(doc):
+            async with semaphore:
+                return await self._call_llm(MAP_PROMPT.format(context=doc.page_content, question=question))
+
+        with metrics.span("map"):
+            metrics.count("chunks", len(docs))
+            return await asyncio.gather(*(map_one(doc) for doc in docs))
+
+    async def _areduce(self, map_outputs, question):
+        summaries = "\n\n".join(output.strip() for output in map_outputs if output.strip())
+        with metrics.span("reduce"):
+            return await self._call_llm(self.reduce_prompt.format(summaries=summaries, question=question))
+
+    async def _aretrieve_and_map(self, query):
+        with metrics.span("retrieval"):
+            docs = await asyncio.to_thread(self.retriever.get_relevant_documents, query)
+            metrics.count("documents", len(docs))
+        return docs, await self._amap(docs, query)
+
+    async def acall(self, query):
+        docs, map_outputs = await self._aretrieve_and_map(query)
+        answer = await self._areduce(map_outputs, query)
+        return {"result": answer, "source_documents": docs, "map_outputs": map_outputs}
+
+    def __call__(self, inputs):
+        return asyncio.run(self.acall(inputs["query"]))
+
+    def _stream_llm(self, prompt):
+        # Yields the completion in pieces; LLMs without .stream() yield it in one piece
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire_sync(estimate_tokens(prompt) + LLM_OUTPUT_TOKENS)
+            started = False
+            try:
+                if not hasattr(self.llm, "stream"):
+                    yield self.llm.predict(prompt)
+                    return
+                for chunk in self.llm.stream(prompt):
+                    started = True
+                    yield getattr(chunk, "content", chunk)
+                return
+            except Exception:
+                # Once tokens have been handed out a retry would duplicate them
+                if started or attempt == self.max_retries:
+                    raise
+                time.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+
+    def stream(self, inputs):
+        # Like __call__, but the reduce step is streamed: yields answer text as it arrives and
+        # leaves the full result in self.last_result once the stream is exhausted.
+        query = inputs["query"]
+        docs, map_outputs = asyncio.run(self._aretrieve_and_map(query))
+        yield from self._stream_reduce(query, docs, map_outputs)
+
+    def stream_reduce(self, inputs, previous=None):
+        # Re-runs only the reduce step, over the retrieved chunks and map outputs of a previous
+        # result (default: self.last_result). One LLM call instead of one per chunk plus one, for
+        # follow-ups such as user feedback that do not need the document read again.
+        previous = previous or self.last_result
+        yield from self._stream_reduce(inputs["query"], previous["source_documents"], previous["map_outputs"])
+
+    def _stream_reduce(self, query, docs, map_outputs):
+        summaries = "\n\n".join(output.strip() for output in map_outputs if output.strip())
+
+        prompt = self.reduce_prompt.format(summaries=summaries, question=query)
+        # Not metrics.span(): a context variable set here would leak into the caller between yields
+        reduce_span = metrics.Span("reduce")
+        key, cached = self._cache_lookup(prompt)
+        if key is not None:
+            reduce_span.add("llm_cache_hits" if cached is not None else "llm_cache_misses")
+        pieces = []
+        try:
+            for piece in [cached] if cached is not None else self._stream_llm(prompt):
+                pieces.append(piece)
+                yield piece
+        except BaseException as e:
+            reduce_span.error = type(e).__name__
+            raise
+        finally:
+            if cached is None:
+                reduce_span.add("llm_calls")
+                reduce_span.add("tokens_in", estimate_tokens(prompt))
+                reduce_span.add("tokens_out", estimate_tokens("".join(pieces)))
+            reduce_span.finish()
+        if key is not None and cached is None:
+            llm_cache.put(key, "".join(pieces))
+        self.last_result = {"result": "".join(pieces), "source_documents": docs, "map_outputs": map_outputs}
+
+
+class StuffQA(AsyncMapReduceQA):
+    # Same interface for documents that fit in one prompt: the whole text stands in for the map
+    # outputs, so every run (and every feedback round) is a single LLM call
+    reduce_prompt = STUFF_PROMPT
+
+    def __init__(self, llm, text, **kwargs):
+        super().__init__(llm, retriever=None, **kwargs)
+        self.text = text
+
+    async def _aretrieve_and_map(self, query):
+        from langchain.schema import Document
+
+        return [Document(page_content=self.text)], [self.text]
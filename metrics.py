@@ -0,0 +1,218 @@
+# metrics.py
+# Stage-level tracing for the extraction pipeline. Each stage runs inside `span(stage)`, which
+# records its duration plus whatever counters the stage reports through `count()` (pages, chunks,
+# tokens in/out, cache hits). Finished spans go to the enclosing `run()` for a per-run breakdown
+# (the in-app performance panel, audit entries, batch records) and to process-wide aggregates
+# that export as JSON or Prometheus text exposition.
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+
+
+# ========== Configuration ==========
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# When set, the aggregates are rewritten here after every run (.prom for a node_exporter
+# textfile collector, anything else for JSON). Each process writes its own snapshot.
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH")
+METRICS_PREFIX = "docuvision"
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+# ========== Spans and Runs ==========
+class Span:
+    # Spans may be counted into from several map tasks or threads at once
+    def __init__(self, stage, **attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.counts = {}
+        self.error = None
+        self.seconds = None
+        self.run = _current_run.get()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self):
+        if self.seconds is not None:
+            return
+        self.seconds = time.perf_counter() - self._started
+        if not METRICS_ENABLED:
+            return
+        _observe(self.stage, self.seconds, self.counts, self.error)
+        if self.run is not None:
+            self.run.spans.append(self.to_dict())
+
+    def to_dict(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "stage": self.stage,
+            "seconds": round(self.seconds or 0.0, 6),
+            "counts": counts,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class Run:
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.spans = []
+        self.started = time.time()
+        self.seconds = None
+
+    def summary(self):
+        # Per-stage totals; a stage can appear several times in one run (e.g. embedding batches)
+        stages = {}
+        for span in list(self.spans):
+            total = stages.setdefault(span["stage"], {"calls": 0, "seconds": 0.0, "errors": 0, "counts": {}})
+            total["calls"] += 1
+            total["seconds"] = round(total["seconds"] + span["seconds"], 6)
+            total["errors"] += span["error"] is not None
+            for name, value in span["counts"].items():
+                total["counts"][name] = total["counts"].get(name, 0) + value
+        return stages
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "attrs": self.attrs,
+            "started": self.started,
+            "seconds": round(self.seconds or 0.0, 6),
+            "stages": self.summary(),
+            "spans": list(self.spans),
+        }
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    current = Span(stage, **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+@contextlib.contextmanager
+def run(name, **attrs):
+    current = Run(name, **attrs)
+    token = _current_run.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - started
+        _current_run.reset(token)
+        if METRICS_EXPORT_PATH and METRICS_ENABLED:
+            try:
+                export(METRICS_EXPORT_PATH)
+            except OSError as e:
+                print(f"[metrics] failed to export to {METRICS_EXPORT_PATH}: {e}")
+
+
+def current_run():
+    return _current_run.get()
+
+
+def count(name, value=1):
+    # Adds to the innermost open span; a no-op outside any span
+    current = _current_span.get()
+    if current is not None:
+        current.add(name, value)
+
+
+# ========== Aggregates ==========
+def _observe(stage, seconds, counts, error):
+    with _stages_lock:
+        total = _stages.setdefault(stage, {
+            "calls": 0, "errors": 0, "seconds": 0.0, "buckets": [0] * len(DURATION_BUCKETS), "counts": {},
+        })
+        total["calls"] += 1
+        total["errors"] += error is not None
+        total["seconds"] += seconds
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                total["buckets"][i] += 1
+        for name, value in counts.items():
+            total["counts"][name] = total["counts"].get(name, 0) + value
+
+
+def merge_run(run_dict):
+    # Folds a run recorded in another process (e.g. a batch worker) into this process's aggregates
+    for item in run_dict.get("spans", ()):
+        _observe(item["stage"], item["seconds"], item["counts"], item["error"])
+
+
+def snapshot():
+    with _stages_lock:
+        return {
+            stage: {**total, "buckets": list(total["buckets"]), "counts": dict(total["counts"])}
+            for stage, total in _stages.items()
+        }
+
+
+def reset():
+    with _stages_lock:
+        _stages.clear()
+
+
+# ========== Export ==========
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def to_json():
+    return json.dumps({"generated": time.time(), "stages": snapshot()}, indent=2)
+
+
+def to_prometheus():
+    stages = snapshot()
+    name = f"{METRICS_PREFIX}_stage_duration_seconds"
+    lines = [f"# HELP {name} Wall-clock time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+    for stage, total in sorted(stages.items()):
+        for bound, observed in zip(DURATION_BUCKETS, total["buckets"]):
+            lines.append(f'{name}_bucket{{stage="{_label(stage)}",le="{bound}"}} {observed}')
+        lines.append(f'{name}_bucket{{stage="{_label(stage)}",le="+Inf"}} {total["calls"]}')
+        lines.append(f'{name}_sum{{stage="{_label(stage)}"}} {total["seconds"]:.6f}')
+        lines.append(f'{name}_count{{stage="{_label(stage)}"}} {total["calls"]}')
+
+    name = f"{METRICS_PREFIX}_stage_errors_total"
+    lines += [f"# HELP {name} Pipeline stage invocations that raised.", f"# TYPE {name} counter"]
+    for stage, total in sorted(stages.items()):
+        lines.append(f'{name}{{stage="{_label(stage)}"}} {total["errors"]}')
+
+    name = f"{METRICS_PREFIX}_stage_items_total"
+    lines += [f"# HELP {name} Items processed per stage (pages, chunks, tokens, cache hits).",
+              f"# TYPE {name} counter"]
+    for stage, total in sorted(stages.items()):
+        for item, value in sorted(total["counts"].items()):
+            lines.append(f'{name}{{stage="{_label(stage)}",item="{_label(item)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    # Written to a temporary file first so scrapers never read a half-written snapshot
+    body = to_prometheus() if path.endswith(".prom") else to_json()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
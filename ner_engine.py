@@ -0,0 +1,107 @@
+# ner_engine.py
+# Offline spaCy NER used by the NER extraction page (our fallback when the LLM API is down).
+# The model is loaded once per process with only the components NER needs, long text is split
+# into segments and run through nlp.pipe, and entities are mapped to fields through a
+# label -> fields index instead of checking every entity against every field. Fields no spaCy
+# label covers (email, phone, invoice number, IBAN, ...) come from pattern_engine, which scans
+# the same page stream.
+import os
+from functools import lru_cache
+
+from pattern_engine import pattern_targets, scan_into
+
+
+# ========== Configuration ==========
+NER_MODEL = os.getenv("NER_MODEL", "en_core_web_sm")
+NER_SEGMENT_CHARS = int(os.getenv("NER_SEGMENT_CHARS", "50000"))  # well under spaCy's max_length
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "16"))
+NER_N_PROCESS = int(os.getenv("NER_N_PROCESS", "1"))
+
+# Components that do not contribute to doc.ents in the en_core_web_* pipelines
+UNUSED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter", "morphologizer"]
+
+# ---------------- PREDEFINED FIELD TO ENTITY MAP ----------------
+PREDEFINED_FIELD_ENTITY_MAP = {
+    "name": ["PERSON"],
+    "organization": ["ORG"],
+    "location": ["GPE", "LOC"],
+    "date": ["DATE"],
+    "time": ["TIME"],
+    "money": ["MONEY"],
+    "percent": ["PERCENT"],
+    "product": ["PRODUCT"],
+    "language": ["LANGUAGE"],
+    "event": ["EVENT"],
+    "nationality": ["NORP"]
+}
+
+# label -> fields that accept it, e.g. {"GPE": ["location"], "LOC": ["location"], ...}
+LABEL_FIELD_INDEX = {}
+for _field, _labels in PREDEFINED_FIELD_ENTITY_MAP.items():
+    for _label in _labels:
+        LABEL_FIELD_INDEX.setdefault(_label, []).append(_field)
+
+
+@lru_cache(maxsize=None)
+def load_nlp(model=NER_MODEL):
+    import spacy
+
+    nlp = spacy.load(model)
+    nlp.select_pipes(disable=[name for name in UNUSED_PIPES if name in nlp.pipe_names])
+    return nlp
+
+
+def iter_segments(text, max_chars=NER_SEGMENT_CHARS):
+    # Cuts at the last newline (or space) before max_chars so entities are rarely split
+    start = 0
+    while start < len(text):
+        end = start + max_chars
+        if end < len(text):
+            cut = text.rfind("\n", start, end)
+            if cut <= start:
+                cut = text.rfind(" ", start, end)
+            if cut > start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+def extract_from_pages(records, fields, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS):
+    # Consumes (page_number, text, source) records, e.g. from iter_pdf_pages, one page at a time
+    results = {field: {} for field in fields}
+
+    # requested label -> result keys, resolved once per call
+    wanted = {field.lower(): field for field in fields}
+    label_index = {}
+    for label, mapped_fields in LABEL_FIELD_INDEX.items():
+        keys = [wanted[f] for f in mapped_fields if f in wanted]
+        if keys:
+            label_index[label] = keys
+
+    targets = pattern_targets(fields)
+
+    def texts():
+        # Each page is scanned for pattern fields as it streams past on its way to spaCy
+        for _, text, _ in records:
+            if targets:
+                scan_into(text, targets, results)
+            yield text
+
+    if label_index:
+        nlp = load_nlp()
+        segments = (segment for text in texts() for segment in iter_segments(text))
+        for doc in nlp.pipe(segments, batch_size=batch_size, n_process=n_process):
+            for ent in doc.ents:
+                for key in label_index.get(ent.label_, ()):
+                    results[key][ent.text] = None
+    elif targets:
+        # Only pattern fields requested: no model is loaded at all
+        for _ in texts():
+            pass
+
+    # dicts keep first-seen order while dropping duplicates
+    return {k: list(v) for k, v in results.items()}
+
+
+def extract_with_custom_fields(text, fields):
+    return extract_from_pages([(1, text, "text")], fields)
@@ -0,0 +1,349 @@
+# ocr_engine.py
+# Page-level OCR scheduler: rasterizes and OCRs scanned PDF pages on a process pool.
+# Pages are preprocessed before Tesseract sees them: a cheap reduced-resolution probe skips blank
+# pages and picks the render DPI from the measured text line height, and pages and photos are
+# OCRed in grayscale.
+import os
+from collections import deque
+
+
+# ========== Configuration ==========
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+OCR_PAGE_TIMEOUT = float(os.getenv("OCR_PAGE_TIMEOUT", "120"))  # seconds per page, 0 = no limit
+OCR_RETRIES = int(os.getenv("OCR_RETRIES", "1"))
+OCR_DPI = 300  # used when adaptive DPI is off or no text lines could be measured
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+OCR_ADAPTIVE_DPI = os.getenv("OCR_ADAPTIVE_DPI", "1") != "0"
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+OCR_TARGET_LINE_PX = 40  # text line height Tesseract reads best (roughly 30 px capitals)
+# Resolution of the preview used for blank detection and line measurement. Below ~150 dpi small
+# print anti-aliases to grey and a page holding only "Total: $5" measures as nearly empty.
+OCR_PROBE_DPI = 150
+OCR_PROBE_MAX_PX = 1650  # photos are probed at this size, about a letter page at OCR_PROBE_DPI
+OCR_SKIP_BLANK = os.getenv("OCR_SKIP_BLANK", "1") != "0"
+# Share of dark pixels below which a page is blank: about 10 pixels on a letter page at the
+# probe DPI, less than a single small digit. Specks of dust cost an OCR call; a skipped page
+# with a total or a signature line on it would lose text silently.
+OCR_BLANK_INK = float(os.getenv("OCR_BLANK_INK", "0.000005"))
+OCR_MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", "16000000"))  # photos are downscaled past this, 0 = never
+
+
+def ocr_settings():
+    # Everything that changes OCR output; callers fold this into their text cache keys
+    return {
+        "ocr_engine": "tesseract",
+        "lang": OCR_LANG,
+        "dpi": "adaptive" if OCR_ADAPTIVE_DPI else OCR_DPI,
+        "grayscale": True,
+        "skip_blank": OCR_BLANK_INK if OCR_SKIP_BLANK else None,
+        "probe_dpi": OCR_PROBE_DPI,
+        "max_image_pixels": OCR_MAX_IMAGE_PIXELS,
+    }
+
+
+# ========== Preprocessing ==========
+def _ink_rows(gray):
+    # Share of dark pixels in each row: binarize at mid-grey, then box-average each row to one pixel
+    from PIL import Image
+
+    binary = gray.point(lambda v: 255 if v < 128 else 0)
+    return [v / 255 for v in binary.resize((1, binary.height), Image.BOX).getdata()]
+
+
+def _line_height(rows):
+    # Median height of the bands of inked rows, i.e. text lines; None when there are too few
+    inked = sorted(ink for ink in rows if ink > 0)
+    if not inked:
+        return None
+    threshold = max(0.005, inked[len(inked) // 2] * 0.25)
+    runs, run = [], 0
+    for ink in rows + [0.0]:
+        if ink > threshold:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    runs = sorted(run for run in runs if run >= 2)
+    if len(runs) < 3:
+        return None
+    return runs[len(runs) // 2]
+
+
+def image_profile(gray, margin=0.05):
+    # (ink ratio, text line height in pixels or None); margins are ignored so scanner edges and
+    # punch holes do not count as content
+    width, height = gray.size
+    body = gray.crop((int(width * margin), int(height * margin),
+                      int(width * (1 - margin)), int(height * (1 - margin))))
+    rows = _ink_rows(body)
+    if not rows:
+        return 0.0, None
+    return sum(rows) / len(rows), _line_height(rows)
+
+
+def _native_dpi(page):
+    # Resolution of the scan embedded in the page; rendering above it only adds pixels
+    page_area = page.rect.width * page.rect.height
+    best = None
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        if (x1 - x0) * (y1 - y0) < page_area * 0.5:
+            continue
+        dpi = max(info["width"], info["height"]) * 72 / max(x1 - x0, y1 - y0)
+        best = max(best or 0, dpi)
+    return best
+
+
+def is_blank(ink):
+    return OCR_SKIP_BLANK and ink < OCR_BLANK_INK
+
+
+def probe_page(page):
+    # (ink ratio, text line height in probe pixels or None) from a render at OCR_PROBE_DPI
+    return image_profile(_render_gray(page, OCR_PROBE_DPI))
+
+
+def choose_dpi(page, line_px, probe_dpi=OCR_PROBE_DPI):
+    dpi = OCR_TARGET_LINE_PX * probe_dpi / line_px if line_px else OCR_DPI
+    native = _native_dpi(page)
+    if native:
+        dpi = min(dpi, native)
+    return int(max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi)) // 10 * 10)
+
+
+def _render_gray(page, dpi):
+    import fitz
+    from PIL import Image
+
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", [pix.width, pix.height], pix.samples)
+
+
+def prepare_image(image):
+    # Grayscale copy of a photo or scan for OCR, downscaled when its text is larger than
+    # Tesseract needs or it exceeds OCR_MAX_IMAGE_PIXELS; None when the image is blank.
+    from PIL import Image
+
+    cap_scale = 1.0
+    if OCR_MAX_IMAGE_PIXELS and image.width * image.height > OCR_MAX_IMAGE_PIXELS:
+        cap_scale = (OCR_MAX_IMAGE_PIXELS / (image.width * image.height)) ** 0.5
+        # JPEGs can be decoded straight to a reduced size, which saves most of the decode cost
+        image.draft("L", (int(image.width * cap_scale), int(image.height * cap_scale)))
+        cap_scale = min(1.0, (OCR_MAX_IMAGE_PIXELS / (image.width * image.height)) ** 0.5)
+    gray = image.convert("L")
+
+    probe = gray.copy()
+    probe.thumbnail((OCR_PROBE_MAX_PX, OCR_PROBE_MAX_PX))
+    ink, line_px = image_profile(probe)
+    if is_blank(ink):
+        return None
+
+    scale = cap_scale
+    if OCR_ADAPTIVE_DPI and line_px:
+        scale = min(scale, OCR_TARGET_LINE_PX / (line_px * gray.width / probe.width))
+    if scale < 0.95:
+        gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.LANCZOS)
+    return gray
+
+
+# ========== Worker Side ==========
+# Each worker opens the PDF once in its initializer, so page tasks only carry a page number.
+_worker_doc = None
+
+
+def _open_pdf(pdf_source):
+    # pdf_source is either raw PDF bytes or a path to a PDF on disk
+    import fitz
+
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source)
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+
+def _init_worker(pdf_source, tesseract_cmd):
+    global _worker_doc
+    import pytesseract
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _worker_doc = _open_pdf(pdf_source)
+
+
+def _ocr_doc_page(doc, page_number, dpi, timeout):
+    # Returns (text, source): source is "blank" for skipped pages, otherwise "ocr".
+    # dpi=None selects the render DPI per page from the probe.
+    import pytesseract
+
+    page = doc[page_number]
+    if OCR_SKIP_BLANK or (dpi is None and OCR_ADAPTIVE_DPI):
+        ink, line_px = probe_page(page)
+        if is_blank(ink):
+            return "", "blank"
+        if dpi is None and OCR_ADAPTIVE_DPI:
+            dpi = choose_dpi(page, line_px)
+
+    image = _render_gray(page, dpi or OCR_DPI)
+    # pytesseract kills the tesseract process and raises RuntimeError once the timeout expires
+    return pytesseract.image_to_string(image, lang=OCR_LANG, timeout=timeout or 0), "ocr"
+
+
+def _ocr_page(page_number, dpi, timeout):
+    return _ocr_doc_page(_worker_doc, page_number, dpi, timeout)
+
+
+# ========== Scheduler ==========
+class _PageScheduler:
+    # Lazily starts one process pool on the first scanned page and retries failed pages on their
+    # own. Workers are started on demand (one per page submitted while none is idle), so a document
+    # never runs more processes than min(workers, scanned pages in flight).
+    def __init__(self, pdf_source, workers, dpi, timeout, retries, tesseract_cmd):
+        self.pdf_source = pdf_source
+        self.workers = workers
+        self.dpi = dpi
+        self.timeout = timeout
+        self.retries = retries
+        self.tesseract_cmd = tesseract_cmd
+        self.pool = None
+        self.spilled = None
+        self.futures = {}
+        self.attempts = {}
+
+    def _start_pool(self):
+        # Imported here: most documents never need a pool, and these modules slow down page loads
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not isinstance(self.pdf_source, str):
+            # In-memory PDFs are written out once, so workers (and restarted pools) get a path
+            # instead of a pickled copy of the whole document each
+            import tempfile
+
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                f.write(self.pdf_source)
+            self.spilled = self.pdf_source = f.name
+        # "spawn" avoids forking the multi-threaded Streamlit server process, and unlike "fork"
+        # lets the pool start its workers on demand
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.pdf_source, self.tesseract_cmd),
+        )
+
+    def submit(self, page_number):
+        if self.pool is None:
+            self._start_pool()
+        self.attempts.setdefault(page_number, 0)
+        self.futures[page_number] = self.pool.submit(_ocr_page, page_number, self.dpi, self.timeout)
+
+    def done(self, page_number):
+        return self.futures[page_number].done()
+
+    def _retry(self, page_number, error):
+        self.attempts[page_number] += 1
+        if self.attempts[page_number] > self.retries:
+            raise RuntimeError(f"OCR failed on page {page_number + 1}: {error}")
+
+    def _recover(self, error):
+        # A worker died and broke the pool, which has already stopped its other workers. There is
+        # no telling which page killed it, so every page it had not finished counts an attempt and
+        # is sent again to a fresh pool.
+        lost = [
+            page_number for page_number, future in self.futures.items()
+            if not future.done() or future.cancelled() or future.exception() is not None
+        ]
+        for page_number in lost:
+            self._retry(page_number, error)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self._start_pool()
+        for page_number in lost:
+            self.futures[page_number] = self.pool.submit(_ocr_page, page_number, self.dpi, self.timeout)
+
+    def result(self, page_number):
+        from concurrent.futures.process import BrokenProcessPool
+
+        while True:
+            try:
+                outcome = self.futures[page_number].result()
+            except BrokenProcessPool as e:
+                self._recover(e)
+                continue
+            except Exception as e:
+                self._retry(page_number, e)
+                self.submit(page_number)
+                continue
+            del self.futures[page_number]
+            return outcome
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        if self.spilled:
+            try:
+                os.remove(self.spilled)
+            except OSError:
+                pass  # Windows: a worker may still hold the file open while it exits
+            self.spilled = None
+
+
+def _ocr_with_retries(doc, page_number, dpi, timeout, retries):
+    for attempt in range(retries + 1):
+        try:
+            return _ocr_doc_page(doc, page_number, dpi, timeout)
+        except Exception as e:
+            if attempt == retries:
+                raise RuntimeError(f"OCR failed on page {page_number + 1}: {e}") from e
+
+
+def iter_pdf_pages(pdf_source, workers=None, dpi=None, timeout=OCR_PAGE_TIMEOUT,
+                   retries=OCR_RETRIES, tesseract_cmd=None):
+    # Yields (page_number, text, source) in page order; source is "text" for the text layer,
+    # "ocr" for rasterized pages and "blank" (with empty text) for pages skipped as blank.
+    # Page numbers start at 1. dpi fixes the render resolution; None picks it per page.
+    workers = workers or OCR_WORKERS
+
+    with _open_pdf(pdf_source) as doc:
+        if workers <= 1:
+            import pytesseract
+
+            if tesseract_cmd:
+                pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+            for i, page in enumerate(doc):
+                text = page.get_text()
+                if text.strip():
+                    yield i + 1, text, "text"
+                else:
+                    yield (i + 1, *_ocr_with_retries(doc, i, dpi, timeout, retries))
+            return
+
+        # Only a bounded window of pages is in flight, so memory stays flat on long documents
+        max_in_flight = workers * 4
+        scheduler = _PageScheduler(pdf_source, workers, dpi, timeout, retries, tesseract_cmd)
+        window = deque()
+        try:
+            for i, page in enumerate(doc):
+                text = page.get_text()
+                if text.strip():
+                    window.append((i, text))
+                else:
+                    scheduler.submit(i)
+                    window.append((i, None))
+
+                while window and (len(window) > max_in_flight
+                                  or window[0][1] is not None or scheduler.done(window[0][0])):
+                    yield _resolve(window.popleft(), scheduler)
+
+            while window:
+                yield _resolve(window.popleft(), scheduler)
+        finally:
+            scheduler.close()
+
+
+def _resolve(entry, scheduler):
+    i, text = entry
+    if text is not None:
+        return i + 1, text, "text"
+    return (i + 1, *scheduler.result(i))
@@ -2,22 +2,47 @@ import streamlit as st
 import pandas as pd
 import json
 import os
-import re
-import io
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import RetrievalQA
-from langchain.schema import Document
+from dotenv import load_dotenv
 from main import input
 from audit_logger import log_to_json
+from pipeline import (build_qa_chain, build_query, build_feedback_query, parse_field_list, stream_records,
+                      stream_feedback_records)
+import metrics
+from exporter import FORMATS, export_frame, frame_fingerprint
 
+load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
 st.set_page_config(page_title="Smart Doc Analyzer")
 st.title("Smart Document Analyzer")
 
+if not openai_api_key:
+    st.error("⚠️ OpenAI API key not found in environment.")
+    st.stop()
+
+EXPORT_FORMATS = {"CSV": "csv", "Excel": "excel", "JSON": "json", "JSONL": "jsonl", "Parquet": "parquet"}
+
+show_performance = st.sidebar.checkbox("⏱️ Show performance panel")
+bypass_cache = st.sidebar.checkbox("♻️ Bypass LLM response cache")
+
+
+def render_performance(runs):
+    # One row per stage of each run: time spent plus the counts the stage reported
+    rows = []
+    for run in runs:
+        for stage, total in run["stages"].items():
+            rows.append({"run": run["name"], "stage": stage, "calls": total["calls"],
+                         "seconds": round(total["seconds"], 3), **total["counts"]})
+    with st.expander("⏱️ Performance", expanded=True):
+        if not rows:
+            st.info("No stages recorded yet.")
+            return
+        st.dataframe(pd.DataFrame(rows).fillna(""))
+        st.download_button("📥 Run metrics (JSON)", json.dumps(runs, indent=2),
+                           file_name="run_metrics.json", mime="application/json")
+        st.download_button("📥 Process metrics (Prometheus)", metrics.to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
+
 # STEP 1: Get extracted text
 extracted_text = input()
 
@@ -28,80 +53,35 @@ if extracted_text and "Error" not in extracted_text:
     st.subheader("Specify Output Fields")
     field_instruction = st.text_input("E.g., name, skills, certifications")
 
-    format_option = st.selectbox("⬇️ Select Output Format", ["CSV", "Excel", "JSON"])
+    format_option = st.selectbox("⬇️ Select Output Format", list(EXPORT_FORMATS))
     start = st.button("Run Extraction")
 
     if start and query and field_instruction:
-        with st.spinner("💬 Thinking..."):
+        with st.spinner("💬 Thinking..."), metrics.run("extraction") as run:
             try:
-                splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-                chunks = splitter.split_text(extracted_text)
-                docs = [Document(page_content=chunk) for chunk in chunks]
-
-                embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
-                db_name="chroma_db"
-    
-                if os.path.exists(db_name):
-                    "checks if the databse with the name specified already exists in the current directory"
-                    Chroma(persist_directory=db_name ,
-                        embedding_function = embeddings).delete_collection()
-
-                vectordb = Chroma.from_documents(
-                    documents=docs,
-                    embedding=embeddings,
-                    persist_directory=db_name
-                )
-                
-                retriever = vectordb.as_retriever(search_kwargs={"k": 20})
-                llm = ChatOpenAI(model="gpt-3.5-turbo", api_key=openai_api_key, temperature=0)
-
-                field_list = [f.strip().capitalize() for f in re.split(r",|and", field_instruction)]
-                formatted_fields = ', '.join(field_list)
+                field_list = parse_field_list(field_instruction)
+                full_query = build_query(query, field_list)
 
-                full_query = (
-                    f"{query}\n\n"
-                    f"Please extract all entries from the text. For each entry, return only the following fields: {formatted_fields}. "
-                    f"Format output clearly by prefixing each field with its name followed by a colon (e.g., Name: John Doe). "
-                    f"Separate each entry clearly with newlines."
-                )
-
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm,
-                    retriever=retriever,
-                    chain_type="map_reduce",
-                    return_source_documents=True
-                )
+                # Short documents are answered in one call; longer ones go through retrieval
+                qa_chain = build_qa_chain(extracted_text, openai_api_key=openai_api_key, query=full_query,
+                                          use_cache=not bypass_cache)
                 st.session_state["qa_chain"] = qa_chain
 
-
-                result = qa_chain({"query": full_query})
-                answer = result["result"]
-
-                # Parse to DataFrame
+                # Rows are shown as soon as the streamed answer completes them
                 entries = []
-                current = {field: "" for field in field_list}
-                lines = answer.strip().splitlines()
+                live_table = st.empty()
+                for row in stream_records(qa_chain, full_query, field_list):
+                    entries.append(row)
+                    live_table.dataframe(pd.DataFrame(entries))
+                live_table.empty()
+
                 log_to_json(
-    query=query,
-    field_instruction=field_instruction,
-    prompt=full_query,
-    llm_output=answer
-)
-
-                for line in lines:
-                    match = re.match(r"^([\w\s]+):\s*(.*)", line)
-                    if match:
-                        key, value = match.groups()
-                        key = key.strip().capitalize()
-                        value = value.strip()
-                        if key in current:
-                            if key == field_list[0] and any(current.values()):
-                                entries.append(current)
-                                current = {f: "" for f in field_list}
-                            current[key] = value
-
-                if any(current.values()):
-                    entries.append(current)
+                    query=query,
+                    field_instruction=field_instruction,
+                    prompt=full_query,
+                    llm_output=qa_chain.last_result["result"],
+                    metrics=run.summary()
+                )
 
                 df = pd.DataFrame(entries)
                 st.session_state["original_df"] = df
@@ -109,6 +89,7 @@ if extracted_text and "Error" not in extracted_text:
 
             except Exception as e:
                 st.error(f"❌ Error during extraction: {e}")
+        st.session_state["run_metrics"] = run.to_dict()
             
 
 
@@ -120,51 +101,46 @@ if extracted_text and "Error" not in extracted_text:
 
         st.subheader("💬 Give Feedback to Improve the Extraction")
         user_feedback = st.text_area("📝 Enter your feedback (e.g., 'Some skills are missing' or 'Extract more details about education')")
+        extra_fields = st.text_input("➕ Additional fields (optional, re-reads the document)")
+        reread = st.checkbox("🔎 Re-read the document instead of reusing the previous retrieval")
 
         if st.button("♻️ Re-Generate Based on Feedback"):
             if user_feedback.strip():
                 try:
                     field_list = edited_df.columns.tolist()
-                    formatted_fields = ', '.join(field_list)
-
-                    feedback_query = (
-                        f"Based on the following feedback: '{user_feedback}', please regenerate the output.\n"
-                        f"Use the original document content and extract only these fields: {formatted_fields}. "
-                        f"Format output clearly by prefixing each field with its name followed by a colon (e.g., Name: John Doe). "
-                        f"Separate each entry clearly with newlines."
-                    )
+                    if extra_fields.strip():
+                        field_list += [f for f in parse_field_list(extra_fields) if f and f not in field_list]
+                    current_rows = edited_df.fillna("").to_dict(orient="records")
+                    feedback_query = build_feedback_query(user_feedback, field_list, current_rows)
 
-                    with st.spinner("🔄 Re-generating based on feedback..."):
+                    with st.spinner("🔄 Re-generating based on feedback..."), metrics.run("feedback") as run:
                         qa_chain = st.session_state.get("qa_chain")
+                        qa_chain.use_cache = not bypass_cache
 
-                        feedback_result = qa_chain({"query": feedback_query})
-                        feedback_answer = feedback_result["result"]
-
-                        # Re-parse the LLM result
+                        # Only the reduce step re-runs unless new fields (or the checkbox) need the
+                        # document read again
                         new_entries = []
-                        current = {field: "" for field in field_list}
-                        lines = feedback_answer.strip().splitlines()
-
-                        for line in lines:
-                            match = re.match(r"^([\w\s]+):\s*(.*)", line)
-                            if match:
-                                key, value = match.groups()
-                                key = key.strip().capitalize()
-                                value = value.strip()
-                                if key in current:
-                                    if key == field_list[0] and any(current.values()):
-                                        new_entries.append(current)
-                                        current = {f: "" for f in field_list}
-                                    current[key] = value
-
-                        if any(current.values()):
-                            new_entries.append(current)
+                        live_table = st.empty()
+                        for row in stream_feedback_records(qa_chain, feedback_query, field_list,
+                                                           reread=reread or bool(extra_fields.strip())):
+                            new_entries.append(row)
+                            live_table.dataframe(pd.DataFrame(new_entries))
+                        live_table.empty()
+
+                        log_to_json(
+                            query=user_feedback,
+                            field_instruction=', '.join(field_list),
+                            prompt=feedback_query,
+                            llm_output=qa_chain.last_result["result"],
+                            metrics=run.summary()
+                        )
 
                         updated_df = pd.DataFrame(new_entries)
                         st.session_state["original_df"] = updated_df
                         st.success("✅ Output updated based on your feedback.")
                         edited_df=updated_df
                         st.dataframe(edited_df)
+                    st.session_state["run_metrics"] = run.to_dict()
 
                 except Exception as e:
                     st.error(f"❌ Error processing feedback: {e}")
@@ -172,32 +148,19 @@ if extracted_text and "Error" not in extracted_text:
                 st.warning("⚠️ Please enter some feedback before clicking re-generate.")
 
 
-                # Optionally send back to LLM or just allow download
-        if format_option == "CSV":
-                    csv = edited_df.to_csv(index=False).encode("utf-8")
-                    st.download_button("📥 Download CSV", csv, file_name="corrected_output.csv", mime="text/csv")
-
-        elif format_option == "Excel":
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        edited_df.to_excel(writer, index=False, sheet_name='Sheet1')
-                    output.seek(0)
-                    st.download_button(
-                        label="📥 Download Excel",
-                        data=output,
-                        file_name="corrected_output.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-        elif format_option == "JSON":
-                    json_data = edited_df.to_dict(orient="records")
-                    st.download_button(
-                        "📥 Download JSON",
-                        json.dumps(json_data, indent=4),
-                        file_name="corrected_output.json",
-                        mime="application/json"
-                    )
-
-           
-
-    
+        # The file is only built when asked for, not on every rerun of the page
+        fmt = EXPORT_FORMATS[format_option]
+        if st.button(f"📦 Prepare {format_option} download"):
+            st.session_state["export"] = {"format": fmt, "fingerprint": frame_fingerprint(edited_df),
+                                          "data": export_frame(edited_df, fmt)}
+        prepared = st.session_state.get("export")
+        if prepared and prepared["format"] == fmt and prepared["fingerprint"] == frame_fingerprint(edited_df):
+            st.download_button(
+                f"📥 Download {format_option}",
+                prepared["data"],
+                file_name="corrected_output" + FORMATS[fmt]["extension"],
+                mime=FORMATS[fmt]["mime"]
+            )
+
+if show_performance:
+    render_performance([st.session_state[key] for key in ("input_metrics", "run_metrics") if key in st.session_state])
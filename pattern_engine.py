@@ -0,0 +1,149 @@
+# pattern_engine.py
+# Rule-based extraction for structured fields spaCy's NER labels do not cover: email, phone,
+# URL, invoice number, IBAN, postcode and amount. Every field pattern is compiled once into a
+# single alternation of named groups, so a document (or each streamed page) is scanned in one
+# left-to-right pass whatever fields are requested. Where a field has a checksum or shape rule
+# (IBAN mod-97, phone digit count) matches are validated before they are kept. Labelled values
+# ("Invoice No: ...", "ZIP code: ...", "Tel: ...") take the label as evidence; unlabelled ones
+# must look unambiguous on their own, so order numbers and year ranges are not read as phones.
+import re
+from functools import lru_cache
+
+
+# ========== Validators ==========
+def _valid_iban(value):
+    compact = value.replace(" ", "")
+    if not 15 <= len(compact) <= 34:
+        return False
+    rearranged = compact[4:] + compact[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+def _has_digit(value):
+    return any(c.isdigit() for c in value)
+
+
+DATE_LIKE_RE = re.compile(r"\d{4}[-./]\d{1,2}[-./]\d{1,2}|\d{1,2}[-./]\d{1,2}[-./]\d{2,4}")
+YEAR_RE = re.compile(r"(?:19|20)\d\d")
+
+
+def _valid_labelled_phone(value):
+    groups = re.findall(r"\d+", value)
+    digits = sum(len(g) for g in groups)
+    if not 7 <= digits <= 15 or DATE_LIKE_RE.fullmatch(value):
+        return False
+    # "2023 2024 2025" is a run of years, not a number
+    return not (len(groups) > 1 and all(YEAR_RE.fullmatch(g) for g in groups))
+
+
+def _valid_phone(value):
+    # Without a label, hyphen-grouped digits ("2024-0001", "2023-2024-2025") are far more often
+    # references and ranges than phone numbers; accept them only with a country code or area code
+    if "-" in value and not value.startswith("+") and "(" not in value:
+        return False
+    return _valid_labelled_phone(value)
+
+
+# ========== Registry ==========
+# (field, pattern, validator). A pattern may mark the part to return with (?P<value>...);
+# otherwise the whole match is returned. Every pattern starts at the start of a word or symbol.
+# Order matters where patterns could match at the same position: the first listed wins, and
+# matched text is not scanned again.
+_CURRENCY = r"(?:USD|EUR|GBP|INR|CHF|CAD|AUD|JPY|CNY)"
+_NUMBER = r"\d{1,3}(?:[,.\u00a0 ]\d{3})*(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?"
+_SEP = r"[-\s:#]"  # between a label and its value
+_PHONE = r"(?:\+\d{1,3}[\s.-]?)?(?:\(\d{1,4}\)[\s.-]?)?\d{2,4}(?:[\s.-]\d{2,4}){1,4}(?![\w-])"
+
+FIELD_PATTERNS = [
+    ("email", r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}", None),
+    ("url", r"\b(?:https?://|www\.)[^\s<>\"'()\[\]]*[^\s<>\"'()\[\].,;:!?]", None),
+    ("iban", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b", _valid_iban),
+    # "INV-2024-0001" / "INV2024": the prefix is part of the number
+    ("invoice number", r"\b(?i:inv)[-/]?\d[A-Za-z0-9/-]*(?<![/-])", None),
+    # "Invoice No.: A-17": the label must end at a word boundary or dot, so "Inventory2024" is skipped
+    ("invoice number",
+     rf"(?i:\binv(?:oice)?(?:\.|\b)(?:{_SEP}*(?:no|num(?:ber)?)(?:\.|\b))?{_SEP}*)"
+     r"(?P<value>(?<![A-Za-z0-9])(?=[A-Za-z0-9/-]*\d)[A-Za-z0-9][A-Za-z0-9/-]{2,})", None),
+    ("amount", rf"(?:[$€£¥₹]|\b{_CURRENCY}\s?)\s?(?:{_NUMBER})(?!\d)", None),
+    ("amount", rf"\b(?:{_NUMBER})\s?(?:[$€£¥₹]|{_CURRENCY}\b)", None),
+    ("phone",
+     rf"(?i:\b(?:phone|tel(?:ephone)?|mobile|cell|fax)(?:\s*(?:no|number)\b)?\.?{_SEP}*)"
+     rf"(?P<value>\+?\d{{7,15}}(?![\w-])|{_PHONE})", _valid_labelled_phone),
+    ("phone", rf"(?<![\w+]){_PHONE}", _valid_phone),
+    ("postcode",
+     rf"(?i:\b(?:post(?:al)?\s?code|zip(?:\s?code)?|pin\s?code){_SEP}*)"
+     r"(?P<value>[A-Za-z0-9][A-Za-z0-9 -]{1,8}[A-Za-z0-9])", _has_digit),
+    ("postcode", r"\b[A-Z]{1,2}\d[A-Z\d]? ?\d[A-Z]{2}\b", None),  # UK
+    ("postcode", r"\b[A-Z]{2} (?P<value>\d{5}(?:-\d{4})?)\b", None),  # US ZIP after a state code
+]
+
+# Other names users type for the same fields
+FIELD_ALIASES = {
+    "e-mail": "email", "email address": "email", "mail": "email",
+    "phone number": "phone", "telephone": "phone", "mobile": "phone", "contact number": "phone",
+    "website": "url", "link": "url",
+    "invoice": "invoice number", "invoice no": "invoice number", "invoice id": "invoice number",
+    "bank account": "iban",
+    "zip": "postcode", "zip code": "postcode", "postal code": "postcode", "pincode": "postcode",
+    "total": "amount", "price": "amount",
+}
+
+PATTERN_FIELDS = {field for field, _, _ in FIELD_PATTERNS}
+
+
+def pattern_field(name):
+    # Canonical field for a requested name, or None when no pattern covers it
+    name = " ".join(name.lower().replace("_", " ").split())
+    name = FIELD_ALIASES.get(name, name)
+    return name if name in PATTERN_FIELDS else None
+
+
+@lru_cache(maxsize=None)
+def _matcher():
+    # One regex for the whole registry; group g<i> is pattern i and g<i>v its value part.
+    # The leading (?<!\w) rejects positions inside a word before any alternative is tried,
+    # which makes the scan about three times faster.
+    alternatives, groups = [], {}
+    for i, (field, pattern, validator) in enumerate(FIELD_PATTERNS):
+        alternatives.append(f"(?P<g{i}>{pattern.replace('(?P<value>', f'(?P<g{i}v>')})")
+        groups[f"g{i}"] = (field, f"g{i}v" if "(?P<value>" in pattern else f"g{i}", validator)
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + ")"), groups
+
+
+# ========== Scanning ==========
+def iter_matches(text):
+    # Yields (field, value) in document order
+    regex, groups = _matcher()
+    for match in regex.finditer(text):
+        field, value_group, validator = groups[match.lastgroup]
+        value = match.group(value_group).strip()
+        if validator is None or validator(value):
+            yield field, value
+
+
+def pattern_targets(fields):
+    # {canonical field: [requested names]} for the requested fields a pattern covers
+    targets = {}
+    for key in fields:
+        field = pattern_field(key)
+        if field:
+            targets.setdefault(field, []).append(key)
+    return targets
+
+
+def scan_into(text, targets, results):
+    # Adds the matches in `text` to results[requested name] (a dict used as an ordered set)
+    for field, value in iter_matches(text):
+        for key in targets.get(field, ()):
+            results.setdefault(key, {})[value] = None
+
+
+def extract_patterns(texts, fields):
+    # `texts` is any iterable of strings, e.g. the pages of a streamed PDF, scanned one by one.
+    # Returns {requested field: [unique values in first-seen order]} for the fields a pattern covers.
+    targets = pattern_targets(fields)
+    results = {key: {} for keys in targets.values() for key in keys}
+    if targets:
+        for text in texts:
+            scan_into(text, targets, results)
+    return {k: list(v) for k, v in results.items()}
@@ -0,0 +1,122 @@
+# pipeline.py
+# Retrieval + field extraction stages shared by the Structured Data Extraction page and the
+# headless batch runner. Nothing here depends on Streamlit.
+import os
+import re
+
+import metrics
+from audit_logger import log_to_json
+from chunking import chunk_budget, token_counter, MODEL_CONTEXT_TOKENS, PROMPT_RESERVE_TOKENS
+from vector_store import get_retriever
+from embedding_cache import get_embeddings
+from map_reduce import AsyncMapReduceQA, StuffQA, STUFF_PROMPT
+from record_parser import iter_records, parse_records
+
+LLM_MODEL = "gpt-3.5-turbo"
+RETRIEVER_K = 20
+# Chunks (in tokens) as large as the model's context allows with RETRIEVER_K map outputs in the
+# reduce prompt: fewer, denser chunks mean fewer map calls
+CHUNK_SIZE, CHUNK_OVERLAP = chunk_budget(LLM_MODEL, RETRIEVER_K)
+# Documents whose prompt stays within this many tokens skip chunking, embedding and retrieval and
+# are extracted with one LLM call
+STUFF_MAX_TOKENS = min(
+    int(os.getenv("STUFF_MAX_TOKENS", "6000")),
+    MODEL_CONTEXT_TOKENS.get(LLM_MODEL, 4096) - PROMPT_RESERVE_TOKENS,
+)
+
+
+def parse_field_list(field_instruction):
+    return [f.strip().capitalize() for f in re.split(r",|and", field_instruction)]
+
+
+def build_query(query, field_list):
+    formatted_fields = ', '.join(field_list)
+    return (
+        f"{query}\n\n"
+        f"Please extract all entries from the text. For each entry, return only the following fields: {formatted_fields}. "
+        f"Format output clearly by prefixing each field with its name followed by a colon (e.g., Name: John Doe). "
+        f"Separate each entry clearly with newlines."
+    )
+
+
+def build_feedback_query(feedback, field_list, rows=None):
+    # `rows` is the current (user-corrected) table, given to the LLM as the output to improve on
+    formatted_fields = ', '.join(field_list)
+    query = (
+        f"Based on the following feedback: '{feedback}', please regenerate the output.\n"
+        f"Use the original document content and extract only these fields: {formatted_fields}. "
+        f"Format output clearly by prefixing each field with its name followed by a colon (e.g., Name: John Doe). "
+        f"Separate each entry clearly with newlines."
+    )
+    if rows:
+        current = "\n\n".join(
+            "\n".join(f"{field}: {row.get(field, '')}" for field in field_list) for row in rows
+        )
+        query += f"\n\nCurrent output, as corrected by the user:\n{current}"
+    return query
+
+
+def stream_records(qa_chain, full_query, field_list):
+    # Yields rows as the streamed answer completes them; the full answer ends up in
+    # qa_chain.last_result["result"]
+    yield from iter_records(qa_chain.stream({"query": full_query}), field_list)
+
+
+def stream_feedback_records(qa_chain, feedback_query, field_list, reread=False):
+    # By default only the reduce step runs again, over the chunks and map outputs kept from the
+    # previous run. reread=True repeats retrieval and the map calls, e.g. for newly added fields
+    # the earlier map outputs may not cover.
+    if reread or getattr(qa_chain, "last_result", None) is None:
+        pieces = qa_chain.stream({"query": feedback_query})
+    else:
+        pieces = qa_chain.stream_reduce({"query": feedback_query})
+    yield from iter_records(pieces, field_list)
+
+
+def plan_chain(text, query=""):
+    # "stuff" when the whole document, the query (with its field list) and the prompt fit in
+    # STUFF_MAX_TOKENS, otherwise "map_reduce"
+    count = token_counter(LLM_MODEL)
+    with metrics.span("plan") as plan:
+        prompt_tokens = count(text) + count(query) + count(STUFF_PROMPT)
+        plan.attrs["chain"] = "stuff" if prompt_tokens <= STUFF_MAX_TOKENS else "map_reduce"
+        metrics.count("prompt_tokens", prompt_tokens)
+    return plan.attrs["chain"]
+
+
+def build_qa_chain(text, openai_api_key=None, query="", use_cache=True):
+    # `query` is the full extraction query; it counts towards the small-document budget.
+    # use_cache=False bypasses the LLM response cache (see llm_cache.py).
+    from langchain.chat_models import ChatOpenAI
+
+    llm = ChatOpenAI(model=LLM_MODEL, api_key=openai_api_key or os.getenv("OPENAI_API_KEY"), temperature=0)
+    if plan_chain(text, query) == "stuff":
+        return StuffQA(llm=llm, text=text, use_cache=use_cache)
+
+    embeddings = get_embeddings()
+
+    # Hybrid vector + BM25 search over this document's chunks; vectors embedded before are reused
+    retriever = get_retriever(text, embeddings, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, k=RETRIEVER_K)
+
+    # Map calls over the retrieved chunks run concurrently, then one reduce call
+    return AsyncMapReduceQA(llm=llm, retriever=retriever, use_cache=use_cache)
+
+
+def run_extraction(text, query, field_instruction, openai_api_key=None, use_cache=True):
+    # Returns (qa_chain, answer, entries) so interactive callers can keep the chain for feedback
+    field_list = parse_field_list(field_instruction)
+    full_query = build_query(query, field_list)
+    qa_chain = build_qa_chain(text, openai_api_key, query=full_query, use_cache=use_cache)
+
+    result = qa_chain({"query": full_query})
+    answer = result["result"]
+
+    run = metrics.current_run()
+    log_to_json(
+        query=query,
+        field_instruction=field_instruction,
+        prompt=full_query,
+        llm_output=answer,
+        metrics=run.summary() if run else None
+    )
+    return qa_chain, answer, parse_records(answer, field_list)
@@ -0,0 +1,78 @@
+# record_parser.py
+# Incremental parser for the LLM's "Field: value" answers. Text can be fed in arbitrary pieces
+# (e.g. streamed tokens); a row is emitted as soon as the next entry starts, so callers can render
+# or write results before the completion has finished. Only the current line and row are buffered.
+# The rows are exactly those of the original line-by-line loop: an entry ends only at the next
+# first field or at the end of the answer, and a repeated field line overwrites the earlier value.
+import re
+
+FIELD_LINE_RE = re.compile(r"^([\w\s]+):\s*(.*)")
+MAX_LINE_CHARS = 65536  # longer lines are truncated rather than buffered without bound
+
+
+class RecordParser:
+    def __init__(self, field_list):
+        self.field_list = list(field_list)
+        self.first_field = self.field_list[0] if self.field_list else None
+        self._buffer = ""
+        self._reset()
+
+    def _reset(self):
+        self.current = {field: "" for field in self.field_list}
+
+    def _take(self):
+        row = self.current
+        self._reset()
+        return row
+
+    def _line(self, line):
+        match = FIELD_LINE_RE.match(line)
+        if not match:
+            return None
+        key, value = match.groups()
+        key = key.strip().capitalize()
+        if key not in self.current:
+            return None
+
+        completed = None
+        # A new first field starts the next entry. The current one cannot be emitted earlier, even
+        # with every field filled: the LLM may still repeat a field line (e.g. one per skill).
+        if key == self.first_field and any(self.current.values()):
+            completed = self._take()
+        self.current[key] = value.strip()
+        return [completed] if completed is not None else None
+
+    def feed(self, text):
+        # Lines are scanned with a moving start index and only the trailing partial line is kept,
+        # so a whole answer fed in one piece is parsed in linear time
+        rows = []
+        buffer = self._buffer + text
+        start = 0
+        while True:
+            newline = buffer.find("\n", start)
+            if newline < 0:
+                break
+            rows.extend(self._line(buffer[start:newline]) or ())
+            start = newline + 1
+        self._buffer = buffer[start:start + MAX_LINE_CHARS]
+        return rows
+
+    def close(self):
+        rows = []
+        if self._buffer:
+            rows.extend(self._line(self._buffer) or ())
+            self._buffer = ""
+        if any(self.current.values()):
+            rows.append(self._take())
+        return rows
+
+
+def iter_records(pieces, field_list):
+    parser = RecordParser(field_list)
+    for piece in pieces:
+        yield from parser.feed(piece)
+    yield from parser.close()
+
+
+def parse_records(answer, field_list):
+    return list(iter_records([answer], field_list))
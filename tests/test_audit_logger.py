@@ -0,0 +1,39 @@
+import os
+import json
+
+import audit_logger
+
+
+def test_failed_write_is_kept_and_replayed(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_logger, "AUDIT_LOG_DIR", str(tmp_path))
+    write_batch = audit_logger._write_batch
+    failures = [OSError("disk full")]
+
+    def flaky_write(entries):
+        if failures:
+            raise failures.pop()
+        write_batch(entries)
+
+    monkeypatch.setattr(audit_logger, "_write_batch", flaky_write)
+
+    audit_logger.log_to_json("first", "name", "prompt", "output")
+    audit_logger.flush()
+    assert os.path.exists(audit_logger._fallback_path())
+    assert audit_logger.search_logs() == []
+
+    audit_logger.log_to_json("second", "name", "prompt", "output")
+    audit_logger.flush()
+    assert not os.path.exists(audit_logger._fallback_path())
+    assert sorted(entry["user_query"] for entry in audit_logger.search_logs()) == ["first", "second"]
+
+
+def test_import_fallback_logs_recovers_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_logger, "AUDIT_LOG_DIR", str(tmp_path))
+    entry = {"timestamp": "2024-01-01T00:00:00", "user_query": "q", "field_instruction": None,
+             "prompt": None, "llm_output": None, "metrics": None}
+    (tmp_path / "audit_log-fallback-1.jsonl").write_text(
+        json.dumps(entry) + "\n{\"timestamp\": ", encoding="utf-8")
+
+    assert audit_logger.import_fallback_logs() == 1
+    assert [e["user_query"] for e in audit_logger.search_logs()] == ["q"]
+    assert not list(tmp_path.glob("audit_log-fallback-*"))
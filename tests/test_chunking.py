@@ -0,0 +1,90 @@
+import pytest
+
+import chunking
+from chunking import NearDuplicateFilter, drop_near_duplicates, strip_repeated_lines
+
+BODIES = [
+    "Invoice INV-001\nCustomer: Acme Corp\nTotal: $1,250.00",
+    "Invoice INV-002\nCustomer: Globex\nTotal: $980.00",
+    "Invoice INV-003\nCustomer: Initech\nTotal: $4,400.00",
+    "Invoice INV-004\nCustomer: Umbrella\nTotal: $75.00",
+]
+
+
+def _pages(header, footers):
+    return [f"{header}\n{body}\n{footer}" for body, footer in zip(BODIES, footers)]
+
+
+@pytest.mark.parametrize("footers", [
+    ["Page 1 of 4", "Page 2 of 4", "Page 3 of 4", "Page 4 of 4"],
+    ["p. 3", "p. 4", "p. 5", "p. 6"],
+    ["1 of 4", "2 of 4", "3 of 4", "4 of 4"],
+    ["- 1 -", "- 2 -", "- 3 -", "- 4 -"],
+    ["12", "13", "14", "15"],
+])
+def test_strip_repeated_lines_removes_headers_and_page_numbers(footers):
+    stripped, removed = strip_repeated_lines(_pages("ACME Billing Ltd, 1 Main St", footers))
+    # The first header and the first page number are kept, every repeat is removed
+    assert removed == 6
+    assert stripped[0] == f"ACME Billing Ltd, 1 Main St\n{BODIES[0]}\n{footers[0]}"
+    assert stripped[1:] == BODIES[1:]
+
+
+@pytest.mark.parametrize("values", [
+    ["1250", "2023", "7", "48"],    # amounts, years and counts at a page edge
+    ["2021", "2023", "2024", "1999"],  # two of them happen to be consecutive
+    ["3", "1", "4", "2"],           # not going up by page
+])
+def test_strip_repeated_lines_keeps_bare_numbers_that_are_not_page_numbers(values):
+    pages = [f"{body}\n{value}" for body, value in zip(BODIES, values)]
+    assert strip_repeated_lines(pages) == (pages, 0)
+
+
+def test_strip_repeated_lines_keeps_per_page_values():
+    pages = [f"Statement\n{body}\nBalance: ${i * 100}.00" for i, body in enumerate(BODIES)]
+    stripped, removed = strip_repeated_lines(pages)
+    assert removed == 3
+    assert all(f"Balance: ${i * 100}.00" in page for i, page in enumerate(stripped))
+
+
+def test_strip_repeated_lines_needs_three_pages():
+    pages = _pages("Header", ["Page 1", "Page 2"])[:2]
+    assert strip_repeated_lines(pages) == (pages, 0)
+
+
+def test_near_duplicate_filter_drops_repeated_boilerplate():
+    boilerplate = ("Terms and conditions: payment is due within thirty days of the invoice date. "
+                   "Late payments are subject to interest at the statutory rate. ") * 3
+    chunks = [boilerplate, boilerplate.upper(), "  ".join(boilerplate.split()), boilerplate + " "]
+    assert drop_near_duplicates(chunks) == [boilerplate]
+
+
+def test_near_duplicate_filter_keeps_records_that_differ_in_a_value():
+    template = ("Invoice number {id} was issued to {name} for consulting services rendered during "
+                "the quarter, payable by bank transfer to the account listed below. Amount due: {amount}.")
+    chunks = [
+        template.format(id="INV-001", name="Acme Corp", amount="$1,250.00"),
+        template.format(id="INV-002", name="Acme Corp", amount="$1,250.00"),
+        template.format(id="INV-001", name="Globex", amount="$1,250.00"),
+        template.format(id="INV-001", name="Acme Corp", amount="$1,205.00"),
+    ]
+    assert drop_near_duplicates(chunks) == chunks
+
+
+def test_near_duplicate_filter_with_distance_zero_only_drops_exact_repeats():
+    seen = NearDuplicateFilter(max_distance=0)
+    assert not seen.is_duplicate("Payment is due within thirty days.")
+    assert seen.is_duplicate("payment is due  within thirty days.")
+    assert not seen.is_duplicate("Payment is due within thirty days!")
+
+
+def test_split_text_strips_headers_but_keeps_content():
+    pytest.importorskip("langchain")
+    footer = "Confidential - ACME Billing Ltd"
+    values = ["1250", "2023", "7", "48"]
+    pages = [f"{body}\n\n{value}\n\n{footer}\nPage {i + 1}" for i, (body, value) in enumerate(zip(BODIES, values))]
+    text = "\n".join(chunking.split_text(chunking.PAGE_SEPARATOR.join(pages), chunk_size=30, chunk_overlap=0))
+    assert all(body in text for body in BODIES)
+    assert [line for line in text.splitlines() if line in values] == values
+    assert text.count(footer) == 1
+    assert "Page 1" in text and "Page 2" not in text
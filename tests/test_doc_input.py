@@ -0,0 +1,48 @@
+import pytest
+
+import doc_buffer
+import doc_input
+
+
+@pytest.fixture
+def opened_buffers(monkeypatch):
+    # Every file on disk is memory-mapped; records each buffer and whether it was closed
+    monkeypatch.setattr(doc_buffer, "DOC_MMAP_MIN_BYTES", 0)
+    buffers = []
+    from_path = doc_buffer.DocumentBuffer.from_path.__func__
+
+    def tracked(cls, path, name=None):
+        buffers.append(from_path(cls, path, name))
+        return buffers[-1]
+
+    monkeypatch.setattr(doc_buffer.DocumentBuffer, "from_path", classmethod(tracked))
+    return buffers
+
+
+def test_txt_from_path_closes_its_mmap(tmp_path, opened_buffers):
+    path = tmp_path / "notes.txt"
+    path.write_text("Name: Jane\n", encoding="utf-8")
+
+    assert doc_input.extract_text_from_txt(str(path)) == "Name: Jane\n"
+    assert len(opened_buffers) == 1 and opened_buffers[0].data.closed
+
+
+def test_pdf_from_path_closes_its_mmap_and_separates_pages(tmp_path, opened_buffers):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for i in range(2):
+        doc.new_page().insert_text((72, 72), f"page {i + 1}")
+    path = tmp_path / "two.pdf"
+    doc.save(str(path))
+
+    text = doc_input.extract_text_from_pdf(str(path))
+    assert [page.strip() for page in text.split("\f")] == ["page 1", "page 2"]
+    assert opened_buffers and all(buffer.data.closed for buffer in opened_buffers)
+
+
+def test_buffer_passed_in_is_left_open(tmp_path, opened_buffers):
+    path = tmp_path / "notes.txt"
+    path.write_text("x", encoding="utf-8")
+    with doc_buffer.as_buffer(str(path)) as doc:
+        doc_input.extract_text_from_txt(doc)
+        assert not doc.data.closed
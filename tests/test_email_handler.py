@@ -0,0 +1,249 @@
+import io
+import os
+import base64
+import random
+import binascii
+
+import pytest
+
+import email_handler
+from email_handler import _fetch_items, _iter_fetched_parts, _write_decoded, attachment_parts, imap_connection
+
+MIXED = (
+    b'1 (UID 17 BODYSTRUCTURE (("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 12 1 NIL NIL NIL NIL)'
+    b'("application" "pdf" ("name" "inv.pdf") NIL NIL "base64" 1000 NIL ("attachment" ("filename" "inv.pdf")) NIL NIL)'
+    b'("image" "png" NIL NIL NIL "base64" 40 NIL ("inline" NIL) NIL NIL)'
+    b' "mixed" ("boundary" "xyz") NIL NIL NIL))'
+)
+
+
+def test_fetch_items_reads_uid_and_structure():
+    (message,) = _fetch_items([MIXED])
+    assert message["UID"] == "17"
+    assert list(attachment_parts(message["BODYSTRUCTURE"])) == [("2", "inv.pdf", "base64", 1000)]
+
+
+def test_fetch_items_reads_literal_filenames():
+    data = [
+        (b'2 (UID 18 BODYSTRUCTURE (("text" "plain" NIL NIL NIL "7bit" 3 1 NIL NIL NIL NIL)'
+         b'("application" "pdf" NIL NIL NIL "base64" 10 NIL ("attachment" ("filename" {7}', b"a b.pdf"),
+        b')) NIL NIL) "mixed" NIL NIL NIL NIL))',
+    ]
+    (message,) = _fetch_items(data)
+    assert list(attachment_parts(message["BODYSTRUCTURE"])) == [("2", "a b.pdf", "base64", 10)]
+
+
+def test_attachment_parts_decodes_filenames():
+    data = [
+        b'3 (UID 19 BODYSTRUCTURE (("application" "pdf" NIL NIL NIL "base64" 10 NIL'
+        b' ("attachment" ("filename*" "utf-8\'\'r%C3%A9sum%C3%A9.pdf")) NIL NIL)'
+        b'("application" "pdf" NIL NIL NIL "base64" 10 NIL'
+        b' ("attachment" ("filename" "=?utf-8?q?caf=C3=A9.pdf?=")) NIL NIL) "mixed" NIL NIL NIL NIL))',
+    ]
+    (message,) = _fetch_items(data)
+    assert [name for _, name, _, _ in attachment_parts(message["BODYSTRUCTURE"])] == ["résumé.pdf", "café.pdf"]
+
+
+def test_attachment_parts_single_part_message():
+    data = [b'4 (UID 20 BODYSTRUCTURE ("application" "pdf" ("name" "x.pdf") NIL NIL "base64" 10 NIL ("attachment" NIL) NIL NIL))']
+    (message,) = _fetch_items(data)
+    assert list(attachment_parts(message["BODYSTRUCTURE"])) == [("1", "x.pdf", "base64", 10)]
+
+
+def test_attachment_parts_inside_forwarded_message():
+    inner = (b'(("text" "plain" NIL NIL NIL "7bit" 3 1 NIL NIL NIL NIL)'
+             b'("application" "pdf" NIL NIL NIL "base64" 10 NIL ("attachment" ("filename" "in.pdf")) NIL NIL) "mixed" NIL NIL NIL NIL)')
+    data = [
+        b'5 (UID 21 BODYSTRUCTURE (("text" "plain" NIL NIL NIL "7bit" 3 1 NIL NIL NIL NIL)'
+        b'("message" "rfc822" NIL NIL NIL "7bit" 500 (NIL NIL NIL NIL NIL NIL NIL NIL NIL NIL) ' + inner +
+        b' 20 NIL ("attachment" ("filename" "fwd.eml")) NIL NIL) "mixed" NIL NIL NIL NIL))',
+    ]
+    (message,) = _fetch_items(data)
+    assert list(attachment_parts(message["BODYSTRUCTURE"])) == [
+        ("2", "fwd.eml", "7bit", 500),
+        ("2.2", "in.pdf", "base64", 10),
+    ]
+
+
+@pytest.mark.parametrize("data", [
+    # UID before the sections
+    [(b"1 (UID 17 BODY[2] {4}", b"QUJD"), (b" BODY[3] {4}", b"REVG"), b")",
+     (b"2 (UID 18 BODY[2] {4}", b"R0hJ"), b")"],
+    # UID after the sections, as some servers send it
+    [(b"1 (BODY[2] {4}", b"QUJD"), (b" BODY[3] {4}", b"REVG"), b" UID 17)",
+     (b"2 (BODY[2] {4}", b"R0hJ"), b" UID 18)"],
+])
+def test_iter_fetched_parts(data):
+    assert list(_iter_fetched_parts(data)) == [("17", "2", b"QUJD"), ("17", "3", b"REVG"), ("18", "2", b"R0hJ")]
+
+
+def _decoded(literal, encoding):
+    buffer = io.BytesIO()
+    _write_decoded(literal, encoding, buffer)
+    return buffer.getvalue()
+
+
+PAYLOAD_SIZES = [0, 1, email_handler.DECODE_CHUNK_BYTES - 1, 3 * email_handler.DECODE_CHUNK_BYTES + 7]
+
+
+@pytest.mark.parametrize("size", PAYLOAD_SIZES)
+def test_write_decoded_base64_across_slices(size):
+    payload = random.Random(size).randbytes(size)
+    literal = base64.encodebytes(payload).replace(b"\n", b"\r\n")
+    assert _decoded(literal, "base64") == payload
+
+
+@pytest.mark.parametrize("size", PAYLOAD_SIZES)
+def test_write_decoded_quoted_printable_across_slices(size):
+    rng = random.Random(size)
+    payload = bytes(rng.choice(b"abc =\xe9\xff\t") for _ in range(size))
+    literal = binascii.b2a_qp(payload).replace(b"\n", b"\r\n")
+    assert _decoded(literal, "quoted-printable") == payload
+
+
+def test_write_decoded_passes_other_encodings_through():
+    payload = b"plain text\r\n" * 20000
+    assert _decoded(payload, "7bit") == payload
+
+
+class FakeIMAP:
+    def __init__(self, password):
+        self.password = password
+        self.logged_out = False
+
+    def logout(self):
+        self.logged_out = True
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def fake_connect(monkeypatch):
+    opened = []
+
+    def connect(imap_server, email_user, email_pass, port, use_ssl):
+        opened.append(FakeIMAP(email_pass))
+        return opened[-1]
+
+    monkeypatch.setattr(email_handler, "_pool", {})
+    monkeypatch.setattr(email_handler, "_connect", connect)
+    return opened
+
+
+def test_pool_reuses_session_only_for_matching_password(fake_connect):
+    with imap_connection("imap.example.com", "jane", "right") as first:
+        pass
+    with imap_connection("imap.example.com", "jane", "wrong") as other:
+        assert other is not first
+        assert other.password == "wrong"
+    with imap_connection("imap.example.com", "jane", "right") as again:
+        assert again is first
+    assert len(fake_connect) == 2
+
+
+def test_pool_logs_out_expired_sessions(fake_connect, monkeypatch):
+    with imap_connection("imap.example.com", "jane", "right") as first:
+        pass
+    monkeypatch.setattr(email_handler, "IMAP_IDLE_SECONDS", 0)
+    with imap_connection("imap.example.com", "jane", "right") as second:
+        assert second is not first
+    assert first.logged_out
+
+
+PDF = b"%PDF-1.4 invoice\n" * 50
+NOTES = "Prix: 12 € net\n".encode("utf-8")
+STRUCTURES = [
+    MIXED,
+    MIXED.replace(b"1 (UID 17", b"2 (UID 18").replace(b'"inv.pdf"', b'"credit.pdf"'),
+    b'3 (UID 19 BODYSTRUCTURE ("text" "plain" ("charset" "utf-8") NIL NIL "quoted-printable" 20 1 NIL'
+    b' ("attachment" ("filename" "notes.txt")) NIL NIL))',
+    b'4 (UID 20 BODYSTRUCTURE ("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 12 1 NIL NIL NIL NIL))',
+]
+
+
+def _literal(prefix, payload):
+    return (prefix + b" {%d}" % len(payload), payload)
+
+
+class RecordedIMAP(FakeIMAP):
+    # Replays the responses a server sent for one mailbox and records every UID command
+    FETCHES = {
+        ("17,18,19,20", "(UID BODYSTRUCTURE)"): STRUCTURES,
+        ("17,18", "(UID BODY.PEEK[2])"): [
+            _literal(b"1 (UID 17 BODY[2]", base64.encodebytes(PDF)), b")",
+            _literal(b"2 (UID 18 BODY[2]", base64.encodebytes(PDF[::-1])), b")",
+        ],
+        ("19", "(UID BODY.PEEK[1])"): [_literal(b"3 (UID 19 BODY[1]", binascii.b2a_qp(NOTES)), b")"],
+    }
+
+    def __init__(self, password="secret"):
+        super().__init__(password)
+        self.commands = []
+
+    def select(self, folder, readonly=False):
+        return "OK", [b"4"]
+
+    def uid(self, command, *args):
+        self.commands.append((command, *args))
+        if command == "SEARCH":
+            return "OK", [b"17 18 19 20"]
+        if command == "FETCH":
+            return "OK", self.FETCHES[args]
+        return "OK", [None]
+
+
+def test_fetch_attachments_for_uids_groups_messages_by_section():
+    mail = RecordedIMAP()
+    attachments = email_handler.fetch_attachments_for_uids(mail, ["17", "18", "19", "20"])
+
+    assert [(att["uid"], att["filename"], att["data"]) for att in attachments] == [
+        ("17", "inv.pdf", PDF),
+        ("18", "credit.pdf", PDF[::-1]),
+        ("19", "notes.txt", NOTES),
+    ]
+    # One BODYSTRUCTURE fetch, then one fetch per attachment layout; UID 20 has no attachments
+    assert [args for command, *args in mail.commands] == [
+        ["17,18,19,20", "(UID BODYSTRUCTURE)"],
+        ["17,18", "(UID BODY.PEEK[2])"],
+        ["19", "(UID BODY.PEEK[1])"],
+    ]
+
+
+def test_fetch_attachments_for_uids_writes_to_dest_dir(tmp_path):
+    attachments = email_handler.fetch_attachments_for_uids(RecordedIMAP(), ["17", "18", "19", "20"], dest_dir=str(tmp_path))
+
+    for att, payload in zip(attachments, [PDF, PDF[::-1], NOTES], strict=True):
+        assert "data" not in att
+        assert os.path.dirname(att["temp_path"]) == str(tmp_path)
+        assert os.path.basename(att["temp_path"]) == f"{att['id']}_{att['filename']}"
+        with open(att["temp_path"], "rb") as f:
+            assert f.read() == payload
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_fetch_attachments_for_uids_without_uids_sends_nothing():
+    mail = RecordedIMAP()
+    assert email_handler.fetch_attachments_for_uids(mail, []) == []
+    assert mail.commands == []
+
+
+def test_fetch_email_attachments_marks_messages_seen(monkeypatch):
+    mail = RecordedIMAP()
+    monkeypatch.setattr(email_handler, "_pool", {})
+    monkeypatch.setattr(email_handler, "_connect", lambda *args: mail)
+
+    attachments = email_handler.fetch_email_attachments("imap.example.com", "jane", "secret")
+    assert [att["filename"] for att in attachments] == ["inv.pdf", "credit.pdf", "notes.txt"]
+    # Bodies are fetched with BODY.PEEK, which leaves \Seen alone, so it is stored explicitly
+    assert not any("BODY[" in arg for _, *args in mail.commands for arg in args if isinstance(arg, str))
+    assert mail.commands[-1] == ("STORE", "17,18,19,20", "+FLAGS", "(\\Seen)")
+
+
+def test_fetch_email_attachments_reports_errors(monkeypatch):
+    def refuse(*args):
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(email_handler, "_pool", {})
+    monkeypatch.setattr(email_handler, "_connect", refuse)
+    assert email_handler.fetch_email_attachments("imap.example.com", "jane", "secret") == [{"error": "connection refused"}]
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+
+import email_ingest
+
+
+class StubMail:
+    # Just enough of imaplib.IMAP4 for poll(): a folder with a UIDVALIDITY and message UIDs
+    def __init__(self, uids, uidvalidity=1):
+        self.uids = uids
+        self.uidvalidity = uidvalidity
+        self.searches = []
+
+    def select(self, folder, readonly=False):
+        return "OK", [str(len(self.uids)).encode()]
+
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode()]
+
+    def uid(self, command, *args):
+        assert command == "SEARCH"
+        self.searches.append(args[-1])
+        return "OK", [" ".join(map(str, self.uids)).encode()]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # An in-memory job store, attachments under tmp_path and one fake attachment per message
+    monkeypatch.setattr(email_ingest, "INGEST_DIR", str(tmp_path / "attachments"))
+
+    def fetch(mail, uids, dest_dir=None):
+        attachments = []
+        for uid in uids:
+            path = os.path.join(dest_dir, f"{uid}.txt")
+            with open(path, "w") as f:
+                f.write(f"message {uid}")
+            attachments.append({"uid": uid, "filename": f"{uid}.txt", "temp_path": path})
+        return attachments
+
+    monkeypatch.setattr(email_ingest, "fetch_attachments_for_uids", fetch)
+    return email_ingest.connect(":memory:")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(email_ingest.time, "time", lambda: now[0])
+    return now
+
+
+def jobs(conn):
+    return [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY id")]
+
+
+def test_poll_enqueues_above_the_high_water_mark(queue):
+    assert email_ingest.poll(queue, StubMail([3, 4, 5]), "INBOX", limit=2) == 2
+    assert [job["uid"] for job in jobs(queue)] == [3, 4]
+
+    mail = StubMail([3, 4, 5])
+    assert email_ingest.poll(queue, mail, "INBOX", limit=10) == 1
+    assert mail.searches == ["UID 5:*"]
+    assert [job["uid"] for job in jobs(queue)] == [3, 4, 5]
+
+
+def test_changed_uidvalidity_rescans_from_uid_1(queue):
+    email_ingest.poll(queue, StubMail([7], uidvalidity=1), "INBOX", limit=10)
+    mail = StubMail([1, 2], uidvalidity=2)
+    assert email_ingest.poll(queue, mail, "INBOX", limit=10) == 2
+    assert mail.searches == ["UID 1:*"]
+    state = queue.execute("SELECT uidvalidity, last_uid FROM mailbox_state").fetchone()
+    assert tuple(state) == (2, 2)
+
+
+def test_failed_enqueue_removes_the_fetched_files(queue):
+    queue.execute("DROP TABLE jobs")
+    with pytest.raises(sqlite3.OperationalError):
+        email_ingest.poll(queue, StubMail([1, 2]), "INBOX", limit=10)
+    assert os.listdir(email_ingest.INGEST_DIR) == []
+    assert queue.execute("SELECT COUNT(*) FROM mailbox_state").fetchone()[0] == 0
+
+
+def test_claim_and_finish(queue, clock):
+    email_ingest.poll(queue, StubMail([1]), "INBOX", limit=10)
+    (job,) = email_ingest.claim(queue, 5)
+    assert jobs(queue)[0]["status"] == "running"
+    assert jobs(queue)[0]["attempts"] == 1
+    assert email_ingest.claim(queue, 5) == []
+
+    email_ingest.finish(queue, job["id"], job["path"], text="hello")
+    assert (jobs(queue)[0]["status"], jobs(queue)[0]["text"]) == ("done", "hello")
+    assert not os.path.exists(job["path"])
+
+
+def test_failures_back_off_then_dead_letter(queue, clock):
+    email_ingest.poll(queue, StubMail([1]), "INBOX", limit=10)
+    delays = []
+    for _ in range(2):
+        (job,) = email_ingest.claim(queue, 1)
+        email_ingest.finish(queue, job["id"], job["path"], error="boom", max_attempts=3)
+        delays.append(jobs(queue)[0]["next_attempt"] - clock[0])
+        assert email_ingest.claim(queue, 1) == []  # not due yet
+        clock[0] += delays[-1]
+    assert delays == [30, 60]
+
+    (job,) = email_ingest.claim(queue, 1)
+    email_ingest.finish(queue, job["id"], job["path"], error="boom", max_attempts=3)
+    assert (jobs(queue)[0]["status"], jobs(queue)[0]["attempts"]) == ("dead", 3)
+    assert os.path.exists(job["path"])  # kept for --retry-dead
+
+    assert email_ingest.requeue_dead(queue) == 1
+    assert (jobs(queue)[0]["status"], jobs(queue)[0]["attempts"]) == ("pending", 0)
+
+
+def test_recover_requeues_running_jobs_and_sweeps_orphans(queue):
+    email_ingest.poll(queue, StubMail([1, 2]), "INBOX", limit=10)
+    email_ingest.claim(queue, 1)
+    orphan = os.path.join(email_ingest.INGEST_DIR, "orphan.pdf")
+    open(orphan, "w").close()
+
+    email_ingest.recover(queue)
+    assert [job["status"] for job in jobs(queue)] == ["pending", "pending"]
+    assert sorted(os.listdir(email_ingest.INGEST_DIR)) == ["1.txt", "2.txt"]
+
+
+def test_backpressure_skips_polling_at_max_pending(queue, monkeypatch):
+    email_ingest.poll(queue, StubMail([1, 2]), "INBOX", limit=10)
+    assert email_ingest.poll_limit(queue, max_pending=2, batch_size=50) == 0
+    assert email_ingest.poll_limit(queue, max_pending=3, batch_size=50) == 1
+    assert email_ingest.poll_limit(queue, max_pending=200, batch_size=50) == 50
+
+    # A full run with --once: the backlog is at --max-pending, so the mailbox is never opened,
+    # and the queue is drained before the run exits
+    @contextmanager
+    def no_mailbox(*args, **kwargs):
+        raise AssertionError("polled despite a full backlog")
+        yield
+
+    monkeypatch.setattr(email_ingest, "connect", lambda: queue)
+    monkeypatch.setattr(email_ingest, "imap_connection", no_mailbox)
+    monkeypatch.setattr(email_ingest, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(email_ingest, "extract_job", lambda path, filename: f"text of {filename}")
+    args = argparse.Namespace(server="imap.example.com", port=None, no_ssl=False, folder="INBOX", workers=2,
+                              poll_interval=30.0, batch_size=50, max_pending=2, max_attempts=3, once=True)
+    email_ingest.run(args, "user", "pass")
+    assert [(job["status"], job["text"]) for job in jobs(queue)] == [("done", "text of 1.txt"), ("done", "text of 2.txt")]
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+
+import pytest
+
+from embedding_cache import CachedEmbeddings, HashEmbeddings
+
+
+class CountingEmbeddings(HashEmbeddings):
+    def __init__(self, dim=16):
+        super().__init__(dim)
+        self.batches = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite")
+
+
+def _rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_cached_vectors_round_trip(cache_path):
+    texts = ["Invoice INV-001", "Customer: Acme Corp", "Invoice INV-001"]
+    embedder = CountingEmbeddings()
+    CachedEmbeddings(embedder, path=cache_path).embed_documents(texts)
+    assert embedder.batches == [["Invoice INV-001", "Customer: Acme Corp"]]  # repeats embedded once
+
+    embedder = CountingEmbeddings()
+    cached = CachedEmbeddings(embedder, path=cache_path)
+    second = cached.embed_documents(texts)
+    assert embedder.batches == []
+    assert cached.stats() == {"hits": 3, "misses": 0}
+    # Vectors come back from their float32 blobs
+    for vector, expected in zip(second, HashEmbeddings(16).embed_documents(texts), strict=True):
+        assert vector == pytest.approx(expected, abs=1e-6)
+
+
+def test_only_misses_reach_the_embedder_in_batches(cache_path):
+    CachedEmbeddings(CountingEmbeddings(), path=cache_path).embed_documents(["a", "b"])
+    embedder = CountingEmbeddings()
+    cached = CachedEmbeddings(embedder, path=cache_path, batch_size=2)
+    cached.embed_documents(["a", "c", "b", "d", "e"])
+    assert embedder.batches == [["c", "d"], ["e"]]
+    assert cached.stats() == {"hits": 2, "misses": 3}
+
+
+def test_changed_model_misses(cache_path):
+    CachedEmbeddings(CountingEmbeddings(dim=16), path=cache_path).embed_documents(["Invoice INV-001"])
+    embedder = CountingEmbeddings(dim=32)
+    vectors = CachedEmbeddings(embedder, path=cache_path).embed_documents(["Invoice INV-001"])
+    assert embedder.batches == [["Invoice INV-001"]]
+    assert len(vectors[0]) == 32
+    assert _rows(cache_path) == 2
+
+
+def test_queries_bypass_the_cache(cache_path):
+    embedder = CountingEmbeddings()
+    cached = CachedEmbeddings(embedder, path=cache_path)
+    for _ in range(2):
+        assert cached.embed_query("What is the total?") == HashEmbeddings(16).embed_query("What is the total?")
+    assert embedder.queries == ["What is the total?"] * 2
+    assert cached.stats() == {"hits": 0, "misses": 0}
+    assert not os.path.exists(cache_path)
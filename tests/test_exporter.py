@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+from exporter import export_bytes
+
+COLUMNS = ["name", "total", "notes"]
+BATCHES = [
+    [{"name": "a", "total": 10, "notes": None}, {"name": "b", "total": 12.5}],
+    [{"name": "c", "total": "n/a", "notes": "late"}, {"name": "d", "total": 7}],
+]
+
+
+def test_parquet_keeps_values_of_columns_that_turn_out_mixed():
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    table = pq.read_table(io.BytesIO(export_bytes(iter(BATCHES), COLUMNS, "parquet")))
+    assert str(table.schema.field("total").type) == "string"
+    assert str(table.schema.field("notes").type) == "string"
+    assert table.column("total").to_pylist() == ["10", "12.5", "n/a", "7"]
+    assert table.column("name").to_pylist() == ["a", "b", "c", "d"]
+
+
+def test_parquet_numeric_column_stays_numeric():
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    batches = [[{"total": 1}, {"total": None}], [{"total": 2.5}]]
+    table = pq.read_table(io.BytesIO(export_bytes(iter(batches), ["total"], "parquet")))
+    assert str(table.schema.field("total").type) == "double"
+    assert table.column("total").to_pylist() == [1.0, None, 2.5]
+
+
+def test_parquet_without_rows():
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    table = pq.read_table(io.BytesIO(export_bytes(iter([]), COLUMNS, "parquet")))
+    assert table.num_rows == 0
+    assert table.column_names == COLUMNS
+
+
+def test_json_and_jsonl_match():
+    rows = [row for batch in BATCHES for row in batch]
+    expected = [{c: row.get(c) for c in COLUMNS} for row in rows]
+    assert json.loads(export_bytes(iter(BATCHES), COLUMNS, "json")) == expected
+    lines = export_bytes(iter(BATCHES), COLUMNS, "jsonl").decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == expected
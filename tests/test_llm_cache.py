@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+from map_reduce import AsyncMapReduceQA, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    return tmp_path
+
+
+class CountingLLM:
+    def __init__(self, model_name="gpt-3.5-turbo", temperature=0, max_tokens=256):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.prompts = []
+
+    async def apredict(self, prompt):
+        self.prompts.append(prompt)
+        return f"response {len(self.prompts)}"
+
+
+def ask(llm, use_cache=True):
+    retriever = SimpleNamespace(get_relevant_documents=lambda query: [SimpleNamespace(page_content="Total: $1,250.00")])
+    qa = AsyncMapReduceQA(llm, retriever, limiter=RateLimiter(rpm=10 ** 9, tpm=10 ** 12), use_cache=use_cache)
+    return qa({"query": "What is the total?"})["result"]
+
+
+def test_repeated_query_is_answered_from_the_cache():
+    first = ask(CountingLLM())
+    llm = CountingLLM()
+    assert ask(llm) == first
+    assert llm.prompts == []
+    assert llm_cache.cache_stats()["entries"] == 2  # one map and one reduce completion
+
+
+@pytest.mark.parametrize("changes", [{"model_name": "gpt-4o"}, {"max_tokens": 512}])
+def test_changed_model_or_params_miss(changes):
+    ask(CountingLLM())
+    llm = CountingLLM(**changes)
+    ask(llm)
+    assert len(llm.prompts) == 2
+    assert llm_cache.cache_stats()["entries"] == 4
+
+
+def test_key_depends_on_params_and_prompt():
+    params = llm_cache.llm_params(CountingLLM())
+    assert llm_cache.cache_key(params, "prompt") == llm_cache.cache_key(dict(reversed(params.items())), "prompt")
+    assert llm_cache.cache_key(params, "prompt") != llm_cache.cache_key(params, "prompt 2")
+    assert llm_cache.cache_key(params, "prompt") != llm_cache.cache_key({**params, "class": "ChatOpenAI"}, "prompt")
+
+
+def test_sampling_llm_is_never_cached():
+    for _ in range(2):
+        llm = CountingLLM(temperature=0.7)
+        ask(llm)
+        assert len(llm.prompts) == 2
+    assert llm_cache.cache_stats()["entries"] == 0
+
+
+def test_use_cache_false_bypasses_reads_and_writes():
+    ask(CountingLLM())
+    llm = CountingLLM()
+    ask(llm, use_cache=False)
+    assert len(llm.prompts) == 2
+
+    llm_cache.clear()
+    ask(CountingLLM(), use_cache=False)
+    assert llm_cache.cache_stats()["entries"] == 0
+
+
+def test_expired_entries_miss(monkeypatch):
+    key = llm_cache.cache_key(llm_cache.llm_params(CountingLLM()), "prompt")
+    llm_cache.put(key, "cached")
+    assert llm_cache.get(key) == "cached"
+    later = llm_cache.time.time() + llm_cache.LLM_CACHE_TTL + 1
+    monkeypatch.setattr(llm_cache.time, "time", lambda: later)
+    assert llm_cache.get(key) is None
+    assert llm_cache.cache_stats()["entries"] == 0
@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import map_reduce
+from map_reduce import AsyncMapReduceQA, RateLimiter
+
+UNLIMITED = RateLimiter(rpm=10 ** 9, tpm=10 ** 12)
+
+
+class FakeLLM:
+    # Answers "map:<n>" per call and "answer" for reduce prompts, after a short delay. `failures`
+    # calls raise before any answer is given; `fail_after_first` streams fail after one piece.
+    def __init__(self, failures=0, fail_after_first=False):
+        self.failures = failures
+        self.fail_after_first = fail_after_first
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    def _answer(self, prompt):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("rate limited")
+        return "answer" if "final answer" in prompt else f"map:{self.calls}"
+
+    async def apredict(self, prompt):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            return self._answer(prompt)
+        finally:
+            self.active -= 1
+
+    def stream(self, prompt):
+        answer = self._answer(prompt)
+        yield "ans"
+        if self.fail_after_first:
+            raise RuntimeError("connection reset")
+        yield answer[3:]
+
+
+class ListRetriever:
+    def __init__(self, count):
+        self.docs = [SimpleNamespace(page_content=f"chunk {i}") for i in range(count)]
+
+    def get_relevant_documents(self, query):
+        return self.docs
+
+
+def make_qa(llm, chunks=3, **kwargs):
+    kwargs.setdefault("limiter", UNLIMITED)
+    return AsyncMapReduceQA(llm, ListRetriever(chunks), use_cache=False, **kwargs)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records backoff delays instead of waiting them out; jitter is pinned to its minimum
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def fake_async_sleep(seconds):
+        if seconds != 0.01:  # FakeLLM latency
+            delays.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(map_reduce.random, "random", lambda: 0.0)
+    monkeypatch.setattr(map_reduce.asyncio, "sleep", fake_async_sleep)
+    monkeypatch.setattr(map_reduce.time, "sleep", delays.append)
+    return delays
+
+
+def test_map_calls_respect_concurrency_cap():
+    llm = FakeLLM()
+    result = make_qa(llm, chunks=20, concurrency=3)({"query": "q"})
+
+    assert llm.max_active == 3
+    assert len(result["map_outputs"]) == 20
+    assert result["result"] == "answer"
+
+
+def test_failed_calls_are_retried_with_backoff(sleeps):
+    llm = FakeLLM(failures=2)
+    assert make_qa(llm, chunks=1, max_retries=2)({"query": "q"})["result"] == "answer"
+    assert sleeps == [0.5, 1.0]
+    assert llm.calls == 4
+
+
+def test_gives_up_after_max_retries(sleeps):
+    with pytest.raises(RuntimeError, match="rate limited"):
+        make_qa(FakeLLM(failures=3), chunks=1, max_retries=2)({"query": "q"})
+    assert sleeps == [0.5, 1.0]
+
+
+def test_rate_limiter_waits_once_the_bucket_is_empty():
+    limiter = RateLimiter(rpm=2, tpm=10 ** 6)
+    assert limiter._try_acquire(10) == 0
+    assert limiter._try_acquire(10) == 0
+    assert limiter._try_acquire(10) == pytest.approx(30, rel=0.01)
+
+
+def test_stream_sets_last_result():
+    qa = make_qa(FakeLLM())
+    assert "".join(qa.stream({"query": "q"})) == "answer"
+    assert qa.last_result["result"] == "answer"
+    assert len(qa.last_result["source_documents"]) == 3
+    assert qa.last_result["map_outputs"] == ["map:1", "map:2", "map:3"]
+
+
+def test_stream_reduce_reuses_map_outputs_and_sets_last_result():
+    llm = FakeLLM()
+    qa = make_qa(llm)
+    first = "".join(qa.stream({"query": "q"}))
+    calls = llm.calls
+    previous = qa.last_result
+
+    assert "".join(qa.stream_reduce({"query": "q, with feedback"})) == first
+    assert llm.calls == calls + 1  # only the reduce call
+    assert qa.last_result is not previous
+    assert qa.last_result["map_outputs"] == previous["map_outputs"]
+
+
+def test_stream_retries_before_the_first_piece_only(sleeps):
+    llm = FakeLLM()
+    qa = make_qa(llm, max_retries=2)
+    "".join(qa.stream({"query": "q"}))
+    llm.failures = 1
+    assert "".join(qa.stream_reduce({"query": "q"})) == "answer"
+    assert sleeps == [0.5]
+
+    llm.fail_after_first = True
+    pieces = []
+    with pytest.raises(RuntimeError, match="connection reset"):
+        for piece in qa.stream_reduce({"query": "q"}):
+            pieces.append(piece)
+    assert pieces == ["ans"]  # not retried: "ans" would be handed out twice
+    assert sleeps == [0.5]
@@ -0,0 +1,176 @@
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+import ocr_engine  # noqa: E402
+
+
+def scanned_page(text, font_px=22, dpi=200):
+    # A letter-size page holding one scanned image with `text` near the top, like a sparse scan
+    image = Image.new("L", (int(8.5 * dpi), 11 * dpi), 255)
+    if text:
+        try:
+            font = ImageFont.load_default(size=font_px)
+        except TypeError:  # Pillow < 10.1
+            font = ImageFont.load_default()
+        ImageDraw.Draw(image).text((int(dpi * 1.2), int(dpi * 1.5)), text, fill=0, font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=buffer.getvalue())
+    return doc, image
+
+
+@pytest.mark.parametrize("text", ["Total: $5", "Approved", "OK", "5"])
+def test_sparse_scanned_page_is_not_blank(text):
+    doc, _ = scanned_page(text)
+    ink, _ = ocr_engine.probe_page(doc[0])
+    assert not ocr_engine.is_blank(ink)
+
+
+@pytest.mark.parametrize("text", ["Total: $5", "Approved"])
+def test_sparse_photo_is_not_blank(text):
+    _, image = scanned_page(text)
+    assert ocr_engine.prepare_image(image) is not None
+
+
+def test_empty_page_is_blank():
+    doc, image = scanned_page("")
+    ink, _ = ocr_engine.probe_page(doc[0])
+    assert ocr_engine.is_blank(ink)
+    assert ocr_engine.prepare_image(image) is None
+
+
+class FakePool:
+    # Stands in for ProcessPoolExecutor: each submit resolves at once with the next scripted
+    # outcome for that page (a value, or an exception to raise)
+    def __init__(self, script, max_workers, **kwargs):
+        self.script = script
+        self.max_workers = max_workers
+
+    def submit(self, fn, page_number, dpi, timeout):
+        from concurrent.futures import Future
+
+        future = Future()
+        outcome = self.script[page_number].pop(0)
+        if isinstance(outcome, BaseException):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture
+def fake_pools(monkeypatch):
+    import concurrent.futures
+
+    pools = []
+
+    def install(script):
+        def make(max_workers, **kwargs):
+            pools.append(FakePool(script, max_workers))
+            return pools[-1]
+
+        monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", make)
+        return pools
+
+    return install
+
+
+def test_broken_pool_charges_every_page_in_flight(fake_pools):
+    from concurrent.futures.process import BrokenProcessPool
+
+    crash = BrokenProcessPool("worker died")
+    pools = fake_pools({0: [crash, ("a", "ocr")], 1: [("b", "ocr")], 2: [crash, ("c", "ocr")]})
+    scheduler = ocr_engine._PageScheduler("doc.pdf", 8, None, None, 1, None)
+    for page_number in range(3):
+        scheduler.submit(page_number)
+
+    assert [scheduler.result(i) for i in range(3)] == [("a", "ocr"), ("b", "ocr"), ("c", "ocr")]
+    # Page 1 had finished before the crash: kept, not charged and not run again
+    assert scheduler.attempts == {0: 1, 1: 0, 2: 1}
+    # One replacement pool for the broken one, never more than `workers` processes
+    assert [pool.max_workers for pool in pools] == [8, 8]
+
+
+def test_broken_pool_gives_up_after_retries(fake_pools):
+    from concurrent.futures.process import BrokenProcessPool
+
+    crash = BrokenProcessPool("worker died")
+    fake_pools({0: [("a", "ocr")], 1: [crash, crash]})
+    scheduler = ocr_engine._PageScheduler("doc.pdf", 2, None, None, 1, None)
+    scheduler.submit(0)
+    scheduler.submit(1)
+
+    assert scheduler.result(0) == ("a", "ocr")
+    with pytest.raises(RuntimeError, match="page 2"):
+        scheduler.result(1)
+
+
+FAKE_TESSERACT = """#!{python}
+# Writes "w<image width>" as the OCR text, so the test can tell pages apart. With FAKE_TESSERACT_FAIL
+# set to a width, the first run on an image of that width fails like a crashed tesseract.
+import os, sys
+from PIL import Image
+
+if sys.argv[1] == "--version":
+    print("tesseract 5.0.0")
+    sys.exit(0)
+width = Image.open(sys.argv[1]).width
+marker = os.path.join(os.environ["FAKE_TESSERACT_DIR"], f"failed-{{width}}")
+if os.environ.get("FAKE_TESSERACT_FAIL") == str(width) and not os.path.exists(marker):
+    open(marker, "w").close()
+    sys.exit("segfault")
+with open(sys.argv[2] + ".txt", "w") as f:
+    f.write(f"w{{width}}")
+"""
+
+
+def mixed_pdf(scanned):
+    # Pages of increasing width; pages in `scanned` hold an image, the others a text layer
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page(width=300 + 36 * i, height=400)
+        if i in scanned:
+            image = Image.new("L", (300, 400), 255)
+            ImageDraw.Draw(image).rectangle((40, 60, 200, 90), fill=0)
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            page.insert_image(page.rect, stream=buffer.getvalue())
+        else:
+            page.insert_text((40, 60), f"text page {i + 1}")
+    return doc
+
+
+def test_iter_pdf_pages_keeps_page_order_and_retries_a_failed_page(tmp_path, monkeypatch):
+    import sys
+
+    pytest.importorskip("pytesseract")
+    tesseract = tmp_path / "tesseract"
+    tesseract.write_text(FAKE_TESSERACT.format(python=sys.executable))
+    tesseract.chmod(0o755)
+    scanned = {1, 3, 4}
+    doc = mixed_pdf(scanned)
+    widths = {i: doc[i].get_pixmap(dpi=100).width for i in scanned}
+    monkeypatch.setenv("FAKE_TESSERACT_DIR", str(tmp_path))
+    monkeypatch.setenv("FAKE_TESSERACT_FAIL", str(widths[3]))
+
+    pages = list(ocr_engine.iter_pdf_pages(doc.tobytes(), workers=2, dpi=100, retries=1,
+                                           tesseract_cmd=str(tesseract)))
+
+    assert [number for number, _, _ in pages] == [1, 2, 3, 4, 5, 6]
+    for number, text, source in pages:
+        if number - 1 in scanned:
+            assert (text, source) == (f"w{widths[number - 1]}", "ocr")
+        else:
+            assert (text.strip(), source) == (f"text page {number}", "text")
+    # Page 4 failed once and succeeded on its retry
+    assert (tmp_path / f"failed-{widths[3]}").exists()
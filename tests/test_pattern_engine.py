@@ -0,0 +1,58 @@
+import pytest
+
+from pattern_engine import extract_patterns, iter_matches
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Contact: jane.doe@example.co.uk", ("email", "jane.doe@example.co.uk")),
+    ("See https://example.com/a?b=1.", ("url", "https://example.com/a?b=1")),
+    ("IBAN GB82 WEST 1234 5698 7654 32", ("iban", "GB82 WEST 1234 5698 7654 32")),
+    ("INV-2024-0001", ("invoice number", "INV-2024-0001")),
+    ("Ref INV2024", ("invoice number", "INV2024")),
+    ("Invoice No.: A-17", ("invoice number", "A-17")),
+    ("Invoice #12345", ("invoice number", "12345")),
+    ("Inv. 555", ("invoice number", "555")),
+    ("Invoice number: INV-2024-0001", ("invoice number", "INV-2024-0001")),
+    ("Total $1,234.50", ("amount", "$1,234.50")),
+    ("Total 99.90 EUR", ("amount", "99.90 EUR")),
+    ("Call +1 555-123-4567", ("phone", "+1 555-123-4567")),
+    ("(555) 123-4567", ("phone", "(555) 123-4567")),
+    ("Phone: 555-123-4567", ("phone", "555-123-4567")),
+    ("Tel 5551234567", ("phone", "5551234567")),
+    ("Mobile no. +44 20 7946 0958", ("phone", "+44 20 7946 0958")),
+    ("555 123 4567", ("phone", "555 123 4567")),
+    ("ZIP: 94105", ("postcode", "94105")),
+    ("ZIP code - 94105", ("postcode", "94105")),
+    ("Postcode: SW1A 1AA", ("postcode", "SW1A 1AA")),
+    ("London EC1A 1BB", ("postcode", "EC1A 1BB")),
+    ("San Francisco, CA 94105", ("postcode", "94105")),
+])
+def test_positive(text, expected):
+    assert expected in list(iter_matches(text))
+
+
+@pytest.mark.parametrize("text", [
+    "ZIP code: Not provided",
+    "Inventory2024",
+    "Invoice date pending",
+    "Period 2023-2024-2025",
+    "Years 2023 2024 2025",
+    "Order 2024-0001",
+    "Issued 2024-01-02",
+    "IBAN GB00 WEST 1234 5698 7654 32",  # bad checksum
+    "Page 12 of 40",
+])
+def test_negative(text):
+    assert list(iter_matches(text)) == []
+
+
+def test_invoice_number_is_not_read_as_phone():
+    assert list(iter_matches("INV-2024-0001")) == [("invoice number", "INV-2024-0001")]
+
+
+def test_extract_patterns_uses_requested_names_across_pages():
+    pages = ["Invoice No: 881-A\nE-mail: a@b.io", "E-mail: c@d.io\nE-mail: a@b.io"]
+    assert extract_patterns(pages, ["Invoice no", "e-mail", "Name"]) == {
+        "Invoice no": ["881-A"],
+        "e-mail": ["a@b.io", "c@d.io"],
+    }
@@ -0,0 +1,79 @@
+import random
+import re
+
+import pytest
+
+from record_parser import RecordParser, iter_records, parse_records
+
+
+def reference_parse(answer, field_list):
+    # The line-by-line loop the structured page used before RecordParser
+    entries = []
+    current = {field: "" for field in field_list}
+    for line in answer.strip().splitlines():
+        match = re.match(r"^([\w\s]+):\s*(.*)", line)
+        if match:
+            key, value = match.groups()
+            key = key.strip().capitalize()
+            value = value.strip()
+            if key in current:
+                if key == field_list[0] and any(current.values()):
+                    entries.append(current)
+                    current = {f: "" for f in field_list}
+                current[key] = value
+    if any(current.values()):
+        entries.append(current)
+    return entries
+
+
+FIELDS = ["Name", "Skills", "Date"]
+
+ANSWERS = [
+    "Name: A\nSkills: x\nDate: 1\n\nName: B\nSkills: y\nDate: 2\n",
+    "Name: A\nSkills: x\nSkills: y\n",
+    "Name: A\nSkills: x\nDate: 1\nSkills: y\nName: B\nDate: 2",
+    "Here are the entries:\n\nName: A\nDate: 1\nNotes: ignored\nName: B\n",
+    "Skills: orphan\nName: A\nSkills: x\n",
+    "  name: A  \r\nSKILLS: x\r\nDate:\r\nName: B\r\n",
+    "No fields here at all",
+    "",
+]
+
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_matches_reference_loop(answer):
+    assert parse_records(answer, FIELDS) == reference_parse(answer, FIELDS)
+
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_matches_reference_loop_when_streamed(answer):
+    rng = random.Random(answer)
+    pieces, start = [], 0
+    while start < len(answer):
+        end = start + rng.randint(1, 7)
+        pieces.append(answer[start:end])
+        start = end
+    assert list(iter_records(pieces, FIELDS)) == reference_parse(answer, FIELDS)
+
+
+def test_repeated_field_does_not_start_an_orphan_row():
+    assert parse_records("Name: A\nSkills: x\nSkills: y\n", FIELDS) == [{"Name": "A", "Skills": "y", "Date": ""}]
+
+
+def test_row_is_emitted_when_the_next_entry_starts():
+    parser = RecordParser(FIELDS)
+    assert parser.feed("Name: A\nSkills: x\nDate: 1\n") == []
+    assert parser.feed("Name: B\n") == [{"Name": "A", "Skills": "x", "Date": "1"}]
+    assert parser.close() == [{"Name": "B", "Skills": "", "Date": ""}]
+
+
+def test_large_answer_in_one_piece_is_parsed_in_linear_time():
+    import time
+
+    entry = "Name: Jane Doe\nSkills: Python, SQL, Spark\nDate: 2024-01-01\n\n"
+    answer = entry * (5 * 1024 * 1024 // len(entry))  # ~5 MB
+    started = time.perf_counter()
+    rows = parse_records(answer, FIELDS)
+    assert time.perf_counter() - started < 5  # the quadratic version took ~50s at this size
+    assert len(rows) == answer.count("Name:")
+    assert rows[-1] == {"Name": "Jane Doe", "Skills": "Python, SQL, Spark", "Date": "2024-01-01"}
@@ -0,0 +1,59 @@
+import pytest
+
+import text_cache
+
+SETTINGS = {"ocr": True, "lang": "eng"}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_ENABLED", True)
+    return tmp_path
+
+
+class Extractor:
+    def __init__(self, text="Invoice INV-001"):
+        self.text = text
+        self.calls = []
+
+    def __call__(self, doc):
+        self.calls.append(doc.data)
+        return self.text
+
+
+def test_second_extraction_is_a_hit():
+    extractor = Extractor()
+    assert text_cache.cached_extract(b"%PDF one", SETTINGS, extractor) == "Invoice INV-001"
+    assert text_cache.cached_extract(b"%PDF one", dict(reversed(SETTINGS.items())), extractor) == "Invoice INV-001"
+    assert extractor.calls == [b"%PDF one"]
+    stats = text_cache.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("data, settings", [
+    (b"%PDF two", SETTINGS),
+    (b"%PDF one", {**SETTINGS, "lang": "deu"}),
+    (b"%PDF one", {**SETTINGS, "ocr": False}),
+])
+def test_changed_content_or_settings_miss(data, settings):
+    text_cache.cached_extract(b"%PDF one", SETTINGS, Extractor())
+    extractor = Extractor("other text")
+    assert text_cache.cached_extract(data, settings, extractor) == "other text"
+    assert extractor.calls == [data]
+
+
+def test_errors_are_not_cached():
+    text_cache.cached_extract(b"%PDF one", SETTINGS, Extractor("[Error] could not open"))
+    extractor = Extractor()
+    assert text_cache.cached_extract(b"%PDF one", SETTINGS, extractor) == "Invoice INV-001"
+    assert len(extractor.calls) == 1
+
+
+def test_disabled_cache_does_not_write(cache_dir, monkeypatch):
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_ENABLED", False)
+    extractor = Extractor()
+    for _ in range(2):
+        assert text_cache.cached_extract(b"%PDF one", SETTINGS, extractor) == "Invoice INV-001"
+    assert len(extractor.calls) == 2
+    assert list(cache_dir.iterdir()) == []
@@ -0,0 +1,138 @@
+# text_cache.py
+# Disk-backed, content-addressed cache for extracted document text.
+# Entries live in one SQLite file (WAL mode), so several Streamlit workers can share it.
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+import metrics
+from doc_buffer import as_buffer
+
+
+# ========== Configuration ==========
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", ".cache")
+TEXT_CACHE_MAX_MB = float(os.getenv("TEXT_CACHE_MAX_MB", "512"))
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "1") != "0"
+
+_local_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(TEXT_CACHE_DIR, "text_cache.sqlite"), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        " key TEXT PRIMARY KEY, text BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+    conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    return conn
+
+
+def _count(conn, name):
+    with _stats_lock:
+        _local_stats[name] += 1
+    conn.execute(
+        "INSERT INTO stats(name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+
+# ========== Public API ==========
+def cache_key(data, settings):
+    # Hash of the file bytes plus the extractor settings that influence the output text
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get(key):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT text FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _count(conn, "misses")
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        _count(conn, "hits")
+        return zlib.decompress(row[0]).decode("utf-8")
+    finally:
+        conn.close()
+
+
+def put(key, text):
+    blob = zlib.compress(text.encode("utf-8"))
+    max_bytes = int(TEXT_CACHE_MAX_MB * 1024 * 1024)
+    if len(blob) > max_bytes:
+        return
+
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries(key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            # Evict least recently used entries until the cache fits its size budget
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > max_bytes:
+                for old_key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                    if total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    total -= size
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def cached_extract(file, settings, extractor):
+    # Runs extractor(doc) only when this exact content + settings has not been seen before.
+    # `file` is anything doc_buffer.as_buffer accepts; the extractor receives the DocumentBuffer.
+    doc = as_buffer(file)
+    try:
+        if not TEXT_CACHE_ENABLED:
+            return extractor(doc)
+
+        key = cache_key(doc.data, settings)
+        text = get(key)
+        metrics.count("text_cache_hits" if text is not None else "text_cache_misses")
+        if text is None:
+            text = extractor(doc)
+            # Extractors report failures as "[Error ...]" strings; those are never cached
+            if not text.startswith("[Error"):
+                put(key, text)
+        return text
+    finally:
+        if doc is not file:
+            doc.close()
+
+
+def cache_stats():
+    conn = _connect()
+    try:
+        shared = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+    finally:
+        conn.close()
+    with _stats_lock:
+        local = dict(_local_stats)
+    return {
+        "hits": shared.get("hits", 0),
+        "misses": shared.get("misses", 0),
+        "process_hits": local["hits"],
+        "process_misses": local["misses"],
+        "entries": entries,
+        "bytes": size,
+    }
@@ -0,0 +1,178 @@
+# vector_index.py
+# In-process retrieval for a single document: chunk vectors live in one contiguous, L2-normalised
+# float32 matrix, so top-k cosine search is a single matrix-vector product. A BM25 keyword scorer
+# runs alongside it and the two are fused, so exact field names, IDs and invoice numbers rank well
+# even when their embeddings are unremarkable. Indexes can be saved as .npy files and memory-mapped
+# back, which makes reopening a document's index nearly free.
+import os
+import re
+import json
+import math
+from collections import Counter
+
+import numpy as np
+
+import metrics
+
+
+# ========== Configuration ==========
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")  # unset: indexes are kept in memory only
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))  # weight of the vector score; 1.0 disables BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+# ========== BM25 ==========
+class BM25:
+    # Postings per term as (chunk index array, term frequency array); a query only touches the
+    # postings of its own terms
+    def __init__(self, texts, k1=BM25_K1, b=BM25_B):
+        self.size = len(texts)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings = {}
+        for i, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            lengths[i] = sum(terms.values())
+            for term, tf in terms.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+
+        average = float(lengths.mean()) if self.size else 0.0
+        # Per-chunk length normalisation, computed once
+        self._norm = k1 * (1 - b + b * lengths / (average or 1.0))
+        self._k1 = k1
+        self.postings = {
+            term: (np.array(rows, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (rows, tfs) in postings.items()
+        }
+
+    def idf(self, term):
+        df = len(self.postings[term][0])
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            rows, tfs = self.postings[term]
+            scores[rows] += self.idf(term) * tfs * (self._k1 + 1) / (tfs + self._norm[rows])
+        return scores
+
+
+# ========== Index ==========
+class VectorIndex:
+    def __init__(self, texts, matrix):
+        self.texts = list(texts)
+        self.matrix = matrix  # (chunks, dim) float32, rows L2-normalised; may be a read-only memmap
+        self.bm25 = BM25(self.texts)
+
+    @classmethod
+    def build(cls, texts, embeddings):
+        if not texts:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        matrix = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return cls(texts, np.ascontiguousarray(matrix))
+
+    def save(self, path):
+        # path without extension; writes path.npy and path.json, each via a temporary file
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.matrix)
+        os.replace(tmp_path, f"{path}.npy")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.texts, f)
+        os.replace(tmp_path, f"{path}.json")
+
+    @classmethod
+    def load(cls, path):
+        # Returns None when there is no complete index at path
+        try:
+            with open(f"{path}.json", encoding="utf-8") as f:
+                texts = json.load(f)
+            matrix = np.load(f"{path}.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if matrix.shape[0] != len(texts):
+            return None
+        return cls(texts, matrix)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def vector_scores(self, query_vector):
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        return self.matrix @ query
+
+    def search(self, query, query_vector, k, alpha=HYBRID_ALPHA):
+        # Returns [(chunk index, score)] best first. Both scores are min-max scaled to [0, 1]
+        # before mixing, since cosine and BM25 live on different scales.
+        if not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        if alpha > 0:
+            scores += alpha * _scaled(self.vector_scores(query_vector))
+        if alpha < 1:
+            scores += (1 - alpha) * _scaled(self.bm25.scores(query))
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def _scaled(scores):
+    low, high = scores.min(), scores.max()
+    if high <= low:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+# ========== Retriever ==========
+class HybridRetriever:
+    # Stands in for vectordb.as_retriever(search_kwargs={"k": k}) in AsyncMapReduceQA
+    def __init__(self, index, embeddings, k=20, alpha=HYBRID_ALPHA):
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.alpha = alpha
+
+    def get_relevant_documents(self, query):
+        from langchain.schema import Document
+
+        # Pure keyword search (alpha=0) needs no query embedding
+        query_vector = self.embeddings.embed_query(query) if self.alpha > 0 else None
+        hits = self.index.search(query, query_vector, self.k, self.alpha)
+        return [
+            Document(page_content=self.index.texts[i], metadata={"chunk": i, "score": round(score, 4)})
+            for i, score in hits
+        ]
+
+    def invoke(self, query):
+        return self.get_relevant_documents(query)
+
+
+def get_index(name, chunks, embeddings):
+    # Reopens the saved index for this collection name when VECTOR_INDEX_DIR is set
+    path = os.path.join(VECTOR_INDEX_DIR, name) if VECTOR_INDEX_DIR else None
+    if path:
+        index = VectorIndex.load(path)
+        if index is not None:
+            metrics.count("collections_reused")
+            return index
+
+    index = VectorIndex.build(chunks(), embeddings)
+    metrics.count("chunks", len(index))
+    if path:
+        index.save(path)
+    return index
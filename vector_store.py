@@ -0,0 +1,116 @@
+# vector_store.py
+# Per-document retrieval, keyed by document content and splitter settings. By default each
+# document gets an in-process NumPy + BM25 index (vector_index.py); VECTOR_BACKEND=chroma keeps
+# persistent Chroma collections instead. A document is embedded once; later queries (and other
+# sessions) reuse its vectors.
+import os
+import time
+import sqlite3
+import hashlib
+from functools import lru_cache
+
+import metrics
+from chunking import split_text, CHUNKING_VERSION
+
+
+# ========== Configuration ==========
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")  # numpy | chroma
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "chroma_db")
+VECTOR_MAX_COLLECTIONS = int(os.getenv("VECTOR_MAX_COLLECTIONS", "50"))
+VECTOR_MAX_CHUNKS = int(os.getenv("VECTOR_MAX_CHUNKS", "200000"))
+
+
+def _registry():
+    os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(VECTOR_DB_DIR, "collections.sqlite"), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS collections ("
+        " name TEXT PRIMARY KEY, chunks INTEGER NOT NULL, last_access REAL NOT NULL)"
+    )
+    return conn
+
+
+def collection_name(text, embedding_model, chunk_size, chunk_overlap):
+    settings = f"{embedding_model}|{chunk_size}|{chunk_overlap}|{CHUNKING_VERSION}|"
+    digest = hashlib.sha256(settings.encode("utf-8"))
+    digest.update(text.encode("utf-8"))
+    # Chroma collection names are limited to 63 characters
+    return f"doc_{digest.hexdigest()[:48]}"
+
+
+@lru_cache(maxsize=None)
+def _client(path):
+    # One persistent Chroma client per process; opening one reloads the on-disk index metadata
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+def _open_collection(name, embeddings):
+    from langchain.vectorstores import Chroma
+
+    return Chroma(collection_name=name, client=_client(VECTOR_DB_DIR), embedding_function=embeddings)
+
+
+def _evict(conn, keep, embeddings):
+    # Drop least recently used collections until both the count and chunk budgets are met
+    rows = conn.execute("SELECT name, chunks FROM collections ORDER BY last_access").fetchall()
+    count = len(rows)
+    total_chunks = sum(chunks for _, chunks in rows)
+    for name, chunks in rows:
+        if count <= VECTOR_MAX_COLLECTIONS and total_chunks <= VECTOR_MAX_CHUNKS:
+            break
+        if name == keep:
+            continue
+        _open_collection(name, embeddings).delete_collection()
+        conn.execute("DELETE FROM collections WHERE name = ?", (name,))
+        count -= 1
+        total_chunks -= chunks
+
+
+def get_vectordb(text, embeddings, chunk_size=800, chunk_overlap=80):
+    # chunk_size and chunk_overlap are in tokens
+    with metrics.span("index"):
+        return _get_vectordb(text, embeddings, chunk_size, chunk_overlap)
+
+
+def _get_vectordb(text, embeddings, chunk_size, chunk_overlap):
+    name = collection_name(text, getattr(embeddings, "model", ""), chunk_size, chunk_overlap)
+    vectordb = _open_collection(name, embeddings)
+
+    conn = _registry()
+    try:
+        known = conn.execute("SELECT 1 FROM collections WHERE name = ?", (name,)).fetchone()
+        if known:
+            conn.execute("UPDATE collections SET last_access = ? WHERE name = ?", (time.time(), name))
+            metrics.count("collections_reused")
+            return vectordb
+
+        # Token-sized chunks without repeated headers/footers or near-duplicates (see chunking.py)
+        chunks = split_text(text, chunk_size, chunk_overlap)
+        metrics.count("chunks", len(chunks))
+        # Deterministic ids make a concurrent build of the same document idempotent
+        vectordb.add_texts(chunks, ids=[f"{name}-{i}" for i in range(len(chunks))])
+
+        conn.execute(
+            "INSERT OR REPLACE INTO collections(name, chunks, last_access) VALUES (?, ?, ?)",
+            (name, len(chunks), time.time()),
+        )
+        _evict(conn, name, embeddings)
+    finally:
+        conn.close()
+    return vectordb
+
+
+def get_retriever(text, embeddings, chunk_size=800, chunk_overlap=80, k=20):
+    # Anything with get_relevant_documents(query), for AsyncMapReduceQA
+    if VECTOR_BACKEND == "chroma":
+        return get_vectordb(text, embeddings, chunk_size, chunk_overlap).as_retriever(search_kwargs={"k": k})
+
+    from vector_index import HybridRetriever, get_index
+
+    with metrics.span("index", backend="numpy"):
+        name = collection_name(text, getattr(embeddings, "model", ""), chunk_size, chunk_overlap)
+        index = get_index(name, lambda: split_text(text, chunk_size, chunk_overlap), embeddings)
+    return HybridRetriever(index, embeddings, k=k)